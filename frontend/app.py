@@ -1,21 +1,67 @@
-from flask import Flask, render_template, redirect, url_for, flash, request, jsonify
+from flask import Flask, render_template, redirect, url_for, flash, request, jsonify, Response, stream_with_context
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user, current_user
 from werkzeug.security import generate_password_hash, check_password_hash
 import os
+import io
+import csv
+import json
+import zlib
+import hashlib
+import time
+import tempfile
+import threading
+from datetime import datetime
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.dialects import postgresql, sqlite
 from werkzeug.utils import secure_filename
+from cid_filter import BloomFilter, listen
+from replicas import ReplicaPool, RoutingSession, read_only, mark_write
 
 app = Flask(__name__)
-app.config['SECRET_KEY'] = os.urandom(24)
+# Set SECRET_KEY when other services (the upload ingester) must read the session cookie
+app.config['SECRET_KEY'] = os.getenv('SECRET_KEY') or os.urandom(24)
 app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL', 'sqlite:///pintrader.db')
 
 UPLOAD_FOLDER = 'uploads'
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
+# Optional async ingestion service that takes over multipart uploads
+app.config['INGEST_URL'] = os.getenv('INGEST_URL')
+
+# Rows fetched per round trip and bytes buffered per chunk when streaming exports
+EXPORT_BATCH_ROWS = 1000
+EXPORT_CHUNK_BYTES = 64 * 1024
+# Bytes read per chunk when streaming an upload to disk
+UPLOAD_CHUNK_BYTES = 1024 * 1024
+EXPORT_COLUMNS = ['id', 'username', 'filename', 'multihash', 'file_size', 'ipfs_status', 'upload_date', 'description']
+
+# Per-user storage quotas (0 means unlimited)
+app.config['USER_QUOTA_BYTES'] = int(os.getenv('USER_QUOTA_BYTES', 0))
+app.config['USER_QUOTA_FILES'] = int(os.getenv('USER_QUOTA_FILES', 0))
+
+# Membership filter over known multihashes and sha256 digests
+app.config['CID_FILTER_SNAPSHOT'] = os.getenv('CID_FILTER_SNAPSHOT', os.path.join(app.instance_path, 'cid_filter.bin'))
+app.config['CID_FILTER_CAPACITY'] = int(os.getenv('CID_FILTER_CAPACITY', 1000000))
+# How often a listening worker rewrites the snapshot with the keys it was notified of
+app.config['CID_FILTER_SAVE_SECONDS'] = float(os.getenv('CID_FILTER_SAVE_SECONDS', 300))
+CID_FILTER_CHANNEL = 'cid_filter'
+CID_FILTER_CATCH_UP = '*'  # Payload asking workers to rescan new rows, sent after bulk imports
+
+# Optional read replicas (comma-separated URLs) for read-heavy views
+app.config['REPLICA_DATABASE_URLS'] = [url for url in os.getenv('REPLICA_DATABASE_URLS', '').split(',') if url]
+app.config['REPLICA_MAX_LAG_SECONDS'] = float(os.getenv('REPLICA_MAX_LAG_SECONDS', 5))
+app.config['REPLICA_CHECK_SECONDS'] = float(os.getenv('REPLICA_CHECK_SECONDS', 10))
+# How long a user's reads stay on the primary after they write
+app.config['REPLICA_STICKY_SECONDS'] = float(os.getenv('REPLICA_STICKY_SECONDS', 30))
 
 # Ensure upload folder exists
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
-db = SQLAlchemy(app)
+db = SQLAlchemy(app, session_options={'class_': RoutingSession})
+if app.config['REPLICA_DATABASE_URLS']:
+    replica_pool = ReplicaPool.from_urls(app.config['REPLICA_DATABASE_URLS'], app.config['REPLICA_MAX_LAG_SECONDS'])
+    replica_pool.start(app.config['REPLICA_CHECK_SECONDS'])
+    app.extensions['replicas'] = replica_pool
 login_manager = LoginManager(app)
 login_manager.login_view = 'login'
 
@@ -32,24 +78,131 @@ class User(UserMixin, db.Model):
     def check_password(self, password):
         return check_password_hash(self.password_hash, password)
 
+    def usage_totals(self):
+        """Return (total bytes, file count) across all statuses from the usage counters"""
+        total_bytes, file_count = db.session.query(
+            db.func.coalesce(db.func.sum(UserUsage.total_bytes), 0),
+            db.func.coalesce(db.func.sum(UserUsage.file_count), 0)
+        ).filter(UserUsage.user_id == self.id).one()
+        return int(total_bytes), int(file_count)
+
 class File(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     filename = db.Column(db.String(255), nullable=False)
-    filepath = db.Column(db.String(255), nullable=False)
+    filepath = db.Column(db.String(255), nullable=True)  # Empty for hash-only registrations
     description = db.Column(db.Text, nullable=True)
     upload_date = db.Column(db.DateTime, nullable=False, default=db.func.current_timestamp())
-    file_size = db.Column(db.Integer, nullable=False)  # Size in bytes
+    file_size = db.Column(db.BigInteger, nullable=False)  # Size in bytes
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     ipfs_status = db.Column(db.String(50), default='pending')  # pending, processing, completed, failed
     multihash = db.Column(db.String(255), nullable=True)  # Make multihash optional
+    sha256 = db.Column(db.String(64), nullable=True, index=True)  # Hex digest of the content, used for dedup
+    ipfs_progress = db.Column(db.BigInteger, nullable=False, default=0, server_default='0')  # Bytes held by the daemon
+    ipfs_attempts = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    ipfs_claimed_at = db.Column(db.DateTime, nullable=True)  # Renewed by the processor while it adds the file
+    __table_args__ = (db.UniqueConstraint('user_id', 'multihash'),)
+
+    def progress_percent(self):
+        """Share of the file the IPFS daemon has received so far"""
+        if not self.file_size:
+            return 0
+        return min(100, int(100 * self.ipfs_progress / self.file_size))
+
+    def content_keys(self):
+        return [key for key in (self.multihash, self.sha256) if key]
 
     def get_size_display(self):
         """Return human-readable file size"""
-        for unit in ['B', 'KB', 'MB', 'GB']:
-            if self.file_size < 1024:
-                return f"{self.file_size:.1f} {unit}"
-            self.file_size /= 1024
-        return f"{self.file_size:.1f} TB"
+        return format_size(self.file_size)
+
+class UserUsage(db.Model):
+    """Incrementally maintained storage counters, one row per user and IPFS status"""
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    status = db.Column(db.String(50), primary_key=True)
+    total_bytes = db.Column(db.BigInteger, nullable=False, default=0)
+    file_count = db.Column(db.Integer, nullable=False, default=0)
+
+class FileTombstone(db.Model):
+    """Content released by a deleted file, waiting for the processor to unpin it"""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, nullable=False)
+    multihash = db.Column(db.String(255), nullable=True)
+    sha256 = db.Column(db.String(64), nullable=True)
+    filepath = db.Column(db.String(255), nullable=True)
+    deleted_at = db.Column(db.DateTime, nullable=False, default=db.func.current_timestamp())
+
+class PinRequest(db.Model):
+    """A user asking for a CID to be pinned by other users"""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    multihash = db.Column(db.String(255), nullable=False)
+    size = db.Column(db.BigInteger, nullable=False)  # Bytes per replica
+    replicas = db.Column(db.Integer, nullable=False, default=1)
+    replicas_filled = db.Column(db.Integer, nullable=False, default=0)
+    duration_days = db.Column(db.Integer, nullable=False)
+    price = db.Column(db.Integer, nullable=False)  # Maximum price per GB-month
+    status = db.Column(db.String(50), nullable=False, default='open', index=True)  # open, filled, cancelled
+    created_at = db.Column(db.DateTime, nullable=False, default=db.func.current_timestamp())
+
+class PinOffer(db.Model):
+    """A user offering pinning capacity to other users"""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    capacity = db.Column(db.BigInteger, nullable=False)  # Bytes
+    capacity_remaining = db.Column(db.BigInteger, nullable=False)
+    duration_days = db.Column(db.Integer, nullable=False)  # Longest agreement accepted
+    price = db.Column(db.Integer, nullable=False)  # Asking price per GB-month
+    status = db.Column(db.String(50), nullable=False, default='open', index=True)  # open, filled, cancelled
+    created_at = db.Column(db.DateTime, nullable=False, default=db.func.current_timestamp())
+
+class PinAgreement(db.Model):
+    """One replica of a pin request placed on a pin offer by the matching engine"""
+    id = db.Column(db.Integer, primary_key=True)
+    request_id = db.Column(db.Integer, db.ForeignKey('pin_request.id'), nullable=False, index=True)
+    offer_id = db.Column(db.Integer, db.ForeignKey('pin_offer.id'), nullable=False, index=True)
+    price = db.Column(db.Integer, nullable=False)  # Agreed price per GB-month
+    size = db.Column(db.BigInteger, nullable=False)
+    duration_days = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=db.func.current_timestamp())
+    request = db.relationship('PinRequest', backref='agreements')
+    offer = db.relationship('PinOffer', backref='agreements')
+
+def record_usage(user_id, status, size, count=1):
+    """Adjust a user's usage counters; the caller commits alongside the file change"""
+    # An upsert, so concurrent first uploads and reconcile_usage never collide on the row
+    dialect = db.session.get_bind(mapper=UserUsage).dialect.name
+    insert = (postgresql if dialect == 'postgresql' else sqlite).insert(UserUsage)
+    db.session.execute(insert.values(
+        user_id=user_id, status=status, total_bytes=size, file_count=count
+    ).on_conflict_do_update(
+        index_elements=['user_id', 'status'],
+        set_={'total_bytes': UserUsage.total_bytes + insert.excluded.total_bytes,
+              'file_count': UserUsage.file_count + insert.excluded.file_count}
+    ))
+
+def check_quota(user, incoming_bytes):
+    """Return an error message if accepting incoming_bytes would exceed the user's quota"""
+    quota_bytes = app.config['USER_QUOTA_BYTES']
+    quota_files = app.config['USER_QUOTA_FILES']
+    if not quota_bytes and not quota_files:
+        return None
+
+    total_bytes, file_count = user.usage_totals()
+    if quota_bytes and total_bytes + incoming_bytes > quota_bytes:
+        return 'Storage quota exceeded'
+    if quota_files and file_count + 1 > quota_files:
+        return 'File count quota exceeded'
+    return None
+
+@app.template_filter('filesize')
+def format_size(size):
+    """Return human-readable size for a byte count"""
+    size = float(size)
+    for unit in ['B', 'KB', 'MB', 'GB']:
+        if size < 1024:
+            return f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} TB"
 
 @login_manager.user_loader
 def load_user(user_id):
@@ -94,6 +247,7 @@ def register():
         user.set_password(password)
         db.session.add(user)
         db.session.commit()
+        mark_write()
         
         flash('Registration successful')
         return redirect(url_for('login'))
@@ -102,8 +256,10 @@ def register():
 
 @app.route('/profile')
 @login_required
+@read_only
 def profile():
-    return render_template('profile.html')
+    total_bytes, file_count = current_user.usage_totals()
+    return render_template('profile.html', usage_bytes=total_bytes, usage_files=file_count)
 
 @app.route('/logout')
 @login_required
@@ -111,6 +267,128 @@ def logout():
     logout_user()
     return redirect(url_for('index'))
 
+cid_filter = None
+cid_filter_lock = threading.Lock()
+cid_filter_saved = 0.0  # When this worker last wrote the snapshot
+
+def _catch_up(bloom):
+    """Add keys for rows inserted after the filter's last_id"""
+    rows = db.session.execute(
+        db.select(File.id, File.multihash, File.sha256).where(File.id > bloom.last_id).order_by(File.id)
+        .execution_options(stream_results=True, yield_per=EXPORT_BATCH_ROWS)
+    )
+    added = 0
+    for file_id, multihash, sha256 in rows:
+        for key in (multihash, sha256):
+            if key:
+                bloom.add(key)
+                added += 1
+        bloom.last_id = file_id
+    return added
+
+def _save_snapshot(bloom, every=0):
+    """Write the filter snapshot unless this worker wrote one in the last `every` seconds"""
+    global cid_filter_saved
+    snapshot = app.config['CID_FILTER_SNAPSHOT']
+    if not snapshot or time.time() - cid_filter_saved < every:
+        return
+    os.makedirs(os.path.dirname(snapshot), exist_ok=True)
+    bloom.save(snapshot)
+    cid_filter_saved = time.time()
+
+def _refresh_cid_filter(bloom):
+    """Catch up on rows committed while the listener was not connected"""
+    with cid_filter_lock, app.app_context():
+        _catch_up(bloom)
+        _save_snapshot(bloom)
+
+def _on_cid_payload(bloom, payload):
+    if payload == CID_FILTER_CATCH_UP:
+        _refresh_cid_filter(bloom)
+        return
+    for key in payload.split():
+        bloom.add(key)
+    # CIDs the processor sets by UPDATE only arrive here, never through a catch-up
+    # by id, so snapshots are refreshed from the listening filter
+    with cid_filter_lock:
+        _save_snapshot(bloom, app.config['CID_FILTER_SAVE_SECONDS'])
+
+def get_cid_filter():
+    """Return this worker's filter, loading the snapshot and catching up on first use"""
+    global cid_filter
+    if cid_filter is not None:
+        return cid_filter
+
+    with cid_filter_lock:
+        if cid_filter is not None:
+            return cid_filter
+
+        snapshot = app.config['CID_FILTER_SNAPSHOT']
+        bloom = BloomFilter.load(snapshot) if snapshot else None
+        if bloom is None or bloom.full:
+            count = db.session.query(db.func.count(File.id)).scalar()
+            bloom = BloomFilter(max(app.config['CID_FILTER_CAPACITY'], 4 * count))
+
+        if db.engine.dialect.name == 'postgresql':
+            # Listen before scanning, so rows committed during the scan arrive as
+            # notifications; the listener catches up again once it is connected
+            threading.Thread(target=listen, args=(db.engine, CID_FILTER_CHANNEL,
+                                                  lambda payload: _on_cid_payload(bloom, payload)),
+                             kwargs={'on_listen': lambda: _refresh_cid_filter(bloom)}, daemon=True).start()
+        if _catch_up(bloom):
+            _save_snapshot(bloom)
+
+        cid_filter = bloom
+        return cid_filter
+
+def maybe_known(key):
+    """False when the filter has not seen this multihash or sha256
+
+    Misses are reliable for rows scanned into the filter or committed while
+    this worker listens. A key set on an existing row while no worker was
+    listening, or a row committing out of id order around a snapshot, can be
+    missed, so a miss only skips work that a constraint or later step still covers.
+    """
+    return key in get_cid_filter()
+
+@db.event.listens_for(File, 'after_insert')
+def _remember_content_keys(mapper, connection, target):
+    keys = target.content_keys()
+    if not keys:
+        return
+    if cid_filter is not None:
+        for key in keys:
+            cid_filter.add(key)
+    if connection.dialect.name == 'postgresql':
+        # Delivered to the other workers only if this transaction commits
+        connection.execute(db.text('SELECT pg_notify(:channel, :keys)'),
+                           {'channel': CID_FILTER_CHANNEL, 'keys': ' '.join(keys)})
+
+def find_known_content(sha256, lock=False):
+    """Return a catalog row holding this content, preferring one that already has a CID
+
+    With lock, the row is share-locked so deleting it waits for the caller's
+    commit, and the processor sees the new reference before unpinning the CID.
+    """
+    if not maybe_known(sha256):
+        return None
+    query = File.query.filter_by(sha256=sha256).order_by(File.multihash.is_(None))
+    return (query.with_for_update(read=True) if lock else query).first()
+
+@app.route('/api/files/exists')
+@login_required
+def file_exists():
+    """Let the upload page skip transferring content the catalog already holds"""
+    sha256 = request.args.get('sha256', '').lower()
+    if len(sha256) != 64:
+        return 'sha256 must be a hex digest', 400
+
+    known = find_known_content(sha256)
+    return jsonify({
+        'exists': known is not None,
+        'multihash': known.multihash if known else None
+    })
+
 @app.route('/upload', methods=['GET', 'POST'])
 @login_required
 def upload():
@@ -120,39 +398,101 @@ def upload():
             
         data = request.get_json()
         
-        if not data.get('multihash'):
+        # Content the catalog holds can be registered by its sha256 alone
+        if not data.get('multihash') and not data.get('sha256'):
             return 'Multihash is required', 400
             
         if not data.get('filename'):
             return 'Filename is required', 400
             
-        if not data.get('fileSize'):
-            return 'File size is required', 400
+        values, error = _positive_ints(data, ['fileSize'])
+        if error:
+            return error, 400
+        file_size = values['fileSize']
+
+        quota_error = check_quota(current_user, file_size)
+        if quota_error:
+            return quota_error, 413
 
-        # Check if multihash already exists
-        existing_file = File.query.filter_by(multihash=data['multihash']).first()
-        if existing_file:
+        # Check if this user already registered the content; the filter skips
+        # the lookups for content nobody has, and the unique constraint covers races
+        duplicate = None
+        if data.get('multihash') and maybe_known(data['multihash']):
+            duplicate = File.query.filter_by(user_id=current_user.id, multihash=data['multihash']).first()
+        if not duplicate and data.get('sha256') and maybe_known(data['sha256']):
+            duplicate = File.query.filter_by(user_id=current_user.id, sha256=data['sha256']).first()
+        if duplicate:
             return 'File with this hash already exists', 400
+
+        multihash = data.get('multihash')
+        status = 'pending'
+        # Content already in the catalog shares its canonical CID and IPFS status
+        known = find_known_content(data['sha256'], lock=True) if data.get('sha256') else None
+        if known:
+            multihash = known.multihash
+            status = 'completed' if known.ipfs_status == 'completed' else 'pending'
+        elif not multihash:
+            return 'Multihash is required', 400
             
         # Create file record in database
         new_file = File(
             filename=data['filename'],
-            multihash=data['multihash'],
+            multihash=multihash,
+            sha256=data.get('sha256'),
             description=data.get('description', ''),
-            file_size=data['fileSize'],
-            user_id=current_user.id
+            file_size=file_size,
+            user_id=current_user.id,
+            ipfs_status=status
         )
         
-        db.session.add(new_file)
-        db.session.commit()
+        try:
+            db.session.add(new_file)
+            record_usage(current_user.id, status, file_size)
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            return 'File with this hash already exists', 400
+        mark_write()
         
         return jsonify({'message': 'File hash registered successfully'})
             
     return render_template('upload.html')
 
+def save_upload(stream):
+    """Stream an upload into the upload folder under its sha256 digest; returns (digest, size)
+
+    Naming files by content keeps same-named uploads from overwriting each
+    other, so a row's sha256 always matches the bytes the processor adds.
+    """
+    sha256 = hashlib.sha256()
+    size = 0
+    fd, partial_path = tempfile.mkstemp(dir=app.config['UPLOAD_FOLDER'], suffix='.part')
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            for chunk in iter(lambda: stream.read(UPLOAD_CHUNK_BYTES), b''):
+                sha256.update(chunk)
+                size += len(chunk)
+                out.write(chunk)
+        digest = sha256.hexdigest()
+        os.replace(partial_path, os.path.join(app.config['UPLOAD_FOLDER'], digest))
+    except BaseException:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+        raise
+    return digest, size
+
 @app.route('/upload_file', methods=['POST'])
 @login_required
 def upload_file():
+    # Reject over-quota uploads before the request body is read; chunked
+    # bodies have no size to check, so they need a Content-Length under a byte quota
+    if request.content_length is None and app.config['USER_QUOTA_BYTES']:
+        return 'Content-Length is required', 411
+    quota_error = check_quota(current_user, request.content_length or 0)
+    if quota_error:
+        flash(quota_error, 'danger')
+        return redirect(url_for('upload'))
+
     if 'file' not in request.files:
         flash('No file selected', 'danger')
         return redirect(url_for('upload'))
@@ -165,21 +505,28 @@ def upload_file():
     if file:
         filename = secure_filename(file.filename)
         # Save file to uploads directory
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(filepath)
+        sha256, file_size = save_upload(file.stream)
+
+        # As in /upload; a second row would collide on the CID the processor assigns
+        if maybe_known(sha256) and File.query.filter_by(user_id=current_user.id, sha256=sha256).first():
+            flash('File with this hash already exists', 'danger')
+            return redirect(url_for('upload'))
         
         # Create file record in database
-        file_size = os.path.getsize(filepath)
         db_file = File(
             filename=filename,
-            filepath=filename,  # Store just the filename
+            filepath=sha256,  # Stored under its digest, relative to the upload folder
+            sha256=sha256,
+            description=request.form.get('description', ''),
             file_size=file_size,
             user_id=current_user.id,
             ipfs_status='pending'  # Will be processed by IPFS service later
         )
         
         db.session.add(db_file)
+        record_usage(current_user.id, 'pending', file_size)
         db.session.commit()
+        mark_write()
         
         flash('File uploaded successfully! IPFS processing will begin shortly.', 'success')
         return redirect(url_for('profile'))
@@ -187,8 +534,203 @@ def upload_file():
     flash('Error uploading file', 'danger')
     return redirect(url_for('upload'))
 
+@app.route('/files/<int:file_id>/delete', methods=['POST'])
+@login_required
+def delete_file(file_id):
+    file = File.query.filter_by(id=file_id, user_id=current_user.id).first_or_404()
+    status = file.ipfs_status
+    # The processor may claim the row meanwhile, so only delete it in the state we read
+    deleted = status != 'processing' and db.session.execute(
+        db.delete(File).where(File.id == file.id, File.ipfs_status == status)
+    ).rowcount
+    if not deleted:
+        db.session.rollback()
+        flash('File is being added to IPFS; delete it once processing finishes', 'warning')
+        return redirect(url_for('profile'))
+
+    # The processor unpins the content once no other row references it
+    db.session.add(FileTombstone(user_id=file.user_id, multihash=file.multihash,
+                                 sha256=file.sha256, filepath=file.filepath))
+    record_usage(file.user_id, status, -file.file_size, -1)
+    db.session.commit()
+    mark_write()
+
+    flash(f'Deleted {file.filename}', 'success')
+    return redirect(url_for('profile'))
+
+@app.route('/uploaded')
+@login_required
+def uploaded():
+    """Landing page after an upload through the ingest service, which cannot write the session"""
+    mark_write()
+    flash('File uploaded successfully! IPFS processing will begin shortly.', 'success')
+    return redirect(url_for('profile'))
+
+def _positive_ints(data, fields):
+    """Return the named JSON fields as ints, or an error message"""
+    values = {}
+    for field in fields:
+        try:
+            values[field] = int(data.get(field))
+        except (TypeError, ValueError):
+            return None, f'{field} is required'
+        if values[field] <= 0:
+            return None, f'{field} must be positive'
+    return values, None
+
+@app.route('/pins')
+@login_required
+def pins():
+    requests_ = PinRequest.query.filter_by(user_id=current_user.id).order_by(PinRequest.created_at.desc()).all()
+    offers = PinOffer.query.filter_by(user_id=current_user.id).order_by(PinOffer.created_at.desc()).all()
+    return render_template('pins.html', pin_requests=requests_, pin_offers=offers)
+
+@app.route('/pins/requests', methods=['POST'])
+@login_required
+def create_pin_request():
+    if not request.is_json:
+        return 'Request must be JSON', 400
+
+    data = request.get_json()
+    if not data.get('multihash'):
+        return 'Multihash is required', 400
+
+    values, error = _positive_ints(data, ['size', 'replicas', 'durationDays', 'price'])
+    if error:
+        return error, 400
+
+    pin_request = PinRequest(
+        user_id=current_user.id,
+        multihash=data['multihash'],
+        size=values['size'],
+        replicas=values['replicas'],
+        duration_days=values['durationDays'],
+        price=values['price']
+    )
+    db.session.add(pin_request)
+    db.session.commit()
+
+    return jsonify({'message': 'Pin request created', 'id': pin_request.id})
+
+@app.route('/pins/offers', methods=['POST'])
+@login_required
+def create_pin_offer():
+    if not request.is_json:
+        return 'Request must be JSON', 400
+
+    data = request.get_json()
+    values, error = _positive_ints(data, ['capacity', 'durationDays', 'price'])
+    if error:
+        return error, 400
+
+    pin_offer = PinOffer(
+        user_id=current_user.id,
+        capacity=values['capacity'],
+        capacity_remaining=values['capacity'],
+        duration_days=values['durationDays'],
+        price=values['price']
+    )
+    db.session.add(pin_offer)
+    db.session.commit()
+
+    return jsonify({'message': 'Pin offer created', 'id': pin_offer.id})
+
+def _export_rows(filters):
+    """Yield catalog rows through a server-side cursor, EXPORT_BATCH_ROWS at a time"""
+    query = db.select(
+        File.id, User.username, File.filename, File.multihash, File.file_size,
+        File.ipfs_status, File.upload_date, File.description
+    ).join(User, File.user_id == User.id).where(*filters).order_by(File.id)
+    result = db.session.execute(query.execution_options(stream_results=True, yield_per=EXPORT_BATCH_ROWS))
+    try:
+        yield from result
+    finally:
+        result.close()
+
+def _ndjson_chunks(rows):
+    buffer = []
+    size = 0
+    for row in rows:
+        record = dict(zip(EXPORT_COLUMNS, row))
+        record['upload_date'] = record['upload_date'].isoformat() if record['upload_date'] else None
+        line = json.dumps(record) + '\n'
+        buffer.append(line)
+        size += len(line)
+        if size >= EXPORT_CHUNK_BYTES:
+            yield ''.join(buffer)
+            buffer = []
+            size = 0
+    if buffer:
+        yield ''.join(buffer)
+
+def _csv_chunks(rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    for row in rows:
+        writer.writerow(row)
+        if buffer.tell() >= EXPORT_CHUNK_BYTES:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+def _gzip_chunks(chunks):
+    compressor = zlib.compressobj(wbits=31)  # gzip container
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode())
+        if data:
+            yield data
+    yield compressor.flush()
+
+EXPORT_FORMATS = {
+    'ndjson': (_ndjson_chunks, 'application/x-ndjson'),
+    'csv': (_csv_chunks, 'text/csv'),
+}
+
+@app.route('/api/export/<fmt>')
+@login_required
+def export_files(fmt):
+    """Stream the file catalog as NDJSON or CSV, optionally filtered and gzipped"""
+    # Reads the primary: a long export on a hot standby gets cancelled by recovery conflicts
+    if fmt not in EXPORT_FORMATS:
+        return 'Format must be ndjson or csv', 400
+
+    filters = []
+    if request.args.get('user'):
+        filters.append(User.username == request.args['user'])
+    if request.args.get('status'):
+        filters.append(File.ipfs_status == request.args['status'])
+    try:
+        if request.args.get('since'):
+            filters.append(File.upload_date >= datetime.fromisoformat(request.args['since']))
+        if request.args.get('until'):
+            filters.append(File.upload_date < datetime.fromisoformat(request.args['until']))
+    except ValueError:
+        return 'Dates must be ISO 8601', 400
+
+    to_chunks, mimetype = EXPORT_FORMATS[fmt]
+    chunks = to_chunks(_export_rows(filters))
+    filename = f'files.{fmt}'
+    headers = {}
+    if request.args.get('gzip') == '1':
+        # Explicit request for a compressed download
+        chunks = _gzip_chunks(chunks)
+        filename += '.gz'
+        mimetype = 'application/gzip'
+    elif 'gzip' in request.headers.get('Accept-Encoding', ''):
+        chunks = _gzip_chunks(chunks)
+        headers['Content-Encoding'] = 'gzip'
+    else:
+        chunks = (chunk.encode() for chunk in chunks)
+    headers['Content-Disposition'] = f'attachment; filename={filename}'
+
+    return Response(stream_with_context(chunks), mimetype=mimetype, headers=headers)
+
 @app.route('/search')
 @login_required
+@read_only
 def search():
     query = request.args.get('q', '').strip()
     users = []
@@ -199,6 +741,7 @@ def search():
 
 @app.route('/profile/<username>')
 @login_required
+@read_only
 def public_profile(username):
     profile_user = User.query.filter_by(username=username).first_or_404()
     return render_template('public_profile.html', profile_user=profile_user)
@@ -0,0 +1,35 @@
+"""Benchmark the pin-agreement order book.
+
+Usage: python bench_matching.py [orders] [batch]
+"""
+import sys
+import time
+import random
+from matching import OrderBook, Offer, Request
+
+GB = 1024 ** 3
+
+def run(orders=200000, batch=5000, seed=1):
+    rng = random.Random(seed)
+    book = OrderBook()
+    matched = 0
+    start = time.perf_counter()
+
+    for first in range(0, orders, batch):
+        for order_id in range(first, min(first + batch, orders)):
+            owner = rng.randrange(1000)
+            if rng.random() < 0.3:
+                book.submit_offer(Offer(order_id, owner, rng.randrange(10, 1000) * GB,
+                                        rng.randrange(50, 150), rng.choice([30, 90, 365])))
+            else:
+                book.submit_request(Request(order_id, owner, rng.randrange(1, 10 * GB),
+                                            rng.randrange(1, 4), rng.randrange(50, 150),
+                                            rng.choice([30, 90, 365])))
+        matched += len(book.match())
+
+    elapsed = time.perf_counter() - start
+    print(f"{orders} orders in {elapsed:.2f}s ({orders / elapsed:,.0f} orders/s), "
+          f"{matched} agreements, {len(book)} orders resting")
+
+if __name__ == '__main__':
+    run(*(int(arg) for arg in sys.argv[1:3]))
@@ -0,0 +1,101 @@
+"""Probabilistic membership filter over content keys (multihashes and sha256 digests).
+
+A miss means the key is definitely not in the file table, so callers can
+skip the lookup; a hit only means it might be. Filters are saved as a
+compact snapshot so workers start without scanning the whole table, and
+kept in sync across workers with Postgres LISTEN/NOTIFY.
+"""
+import os
+import math
+import time
+import select
+import struct
+import hashlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Snapshot header: magic, bit count, hash count, key count, capacity, last file id
+_HEADER = struct.Struct('<4sQIQQQ')
+_MAGIC = b'CIDF'
+
+class BloomFilter:
+    def __init__(self, capacity, error_rate=0.01):
+        self.capacity = capacity
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+        self.last_id = 0  # Highest file id covered, used to catch up after loading a snapshot
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, key):
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+    @property
+    def full(self):
+        return self.count > self.capacity
+
+    def save(self, path):
+        """Write the filter atomically so concurrent workers never read a partial snapshot"""
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(_HEADER.pack(_MAGIC, self.size, self.hashes, self.count, self.capacity, self.last_id))
+            f.write(self.bits)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """Return the saved filter, or None if there is no usable snapshot"""
+        try:
+            with open(path, 'rb') as f:
+                magic, size, hashes, count, capacity, last_id = _HEADER.unpack(f.read(_HEADER.size))
+                bits = bytearray(f.read())
+        except (OSError, struct.error):
+            return None
+        if magic != _MAGIC or len(bits) != (size + 7) // 8:
+            return None
+
+        bloom = cls.__new__(cls)
+        bloom.capacity = capacity
+        bloom.size = size
+        bloom.hashes = hashes
+        bloom.bits = bits
+        bloom.count = count
+        bloom.last_id = last_id
+        return bloom
+
+def listen(engine, channel, on_payload, on_listen=None, timeout=30):
+    """Call on_payload for every NOTIFY on channel; runs forever, reconnecting on errors
+
+    on_listen runs once LISTEN is in effect after each (re)connect, so the
+    caller can pick up whatever was committed while nothing was listening.
+    """
+    while True:
+        try:
+            raw = engine.raw_connection()
+            conn = raw.driver_connection  # Cleared by detach
+            raw.detach()  # Keep this long-lived connection out of the pool
+            conn.autocommit = True
+            conn.cursor().execute(f'LISTEN {channel}')
+            if on_listen:
+                on_listen()
+            while True:
+                if select.select([conn], [], [], timeout) == ([], [], []):
+                    continue
+                conn.poll()
+                while conn.notifies:
+                    on_payload(conn.notifies.pop(0).payload)
+        except Exception as e:
+            logger.warning(f"Lost {channel} listener, reconnecting: {e}")
+            time.sleep(5)
@@ -0,0 +1,292 @@
+"""Bulk import of existing CID catalogs and directory trees.
+
+Usage:
+    python import_files.py manifest <username> <catalog.csv|catalog.ndjson>
+    python import_files.py directory <username> <root> [--processes N]
+
+Manifests use the columns of the export API (filename, multihash,
+file_size, sha256, description); NDJSON lines may also use the /upload
+keys such as fileSize, and other columns are ignored. Rows are loaded
+with COPY into a staging table and merged into the file table in one
+transaction, with the same rules as /upload: content the catalog already
+holds shares its canonical CID and status, and rows the user already has
+are skipped. Directory imports hash files across processes, copy new
+content into the upload folder and queue it for the IPFS processor; files
+changed since they were hashed are skipped.
+Quotas are not enforced. Requires PostgreSQL.
+"""
+import os
+import csv
+import sys
+import hashlib
+import argparse
+import tempfile
+from multiprocessing import Pool
+from app import app, db, User, UPLOAD_CHUNK_BYTES, CID_FILTER_CHANNEL, CID_FILTER_CATCH_UP
+
+STAGING_COLUMNS = ['filename', 'multihash', 'sha256', 'description', 'file_size']
+HASH_CHUNKSIZE = 64  # Files handed to a hashing process at a time
+
+CREATE_STAGING = """
+    CREATE TEMP TABLE file_import (
+        row_id BIGSERIAL PRIMARY KEY,
+        filename TEXT,
+        multihash TEXT,
+        sha256 TEXT,
+        description TEXT,
+        file_size BIGINT,
+        source TEXT,  -- Local path, directory imports only
+        ipfs_status TEXT NOT NULL DEFAULT 'pending',
+        known BOOLEAN NOT NULL DEFAULT false
+    ) ON COMMIT DROP
+"""
+
+MERGE_STEPS = [
+    # Required fields, as for /upload; directory rows are identified by sha256 instead of a CID
+    ('invalid', """
+        DELETE FROM file_import
+        WHERE filename IS NULL OR file_size IS NULL OR (multihash IS NULL AND source IS NULL)
+    """),
+    # Content the catalog already holds shares its canonical CID and status
+    ('known', """
+        UPDATE file_import s
+        SET multihash = COALESCE(k.multihash, s.multihash),
+            ipfs_status = CASE WHEN k.ipfs_status = 'completed' THEN 'completed' ELSE 'pending' END,
+            known = true
+        FROM (
+            SELECT DISTINCT ON (sha256) sha256, multihash, ipfs_status
+            FROM file
+            WHERE sha256 IN (SELECT sha256 FROM file_import)
+            ORDER BY sha256, multihash IS NULL, id
+        ) k
+        WHERE s.sha256 = k.sha256
+    """),
+    # Content the user already has
+    ('already registered', """
+        DELETE FROM file_import s
+        USING file f
+        WHERE f.user_id = :user_id AND f.multihash = s.multihash
+    """),
+    ('already registered', """
+        DELETE FROM file_import s
+        USING file f
+        WHERE f.user_id = :user_id AND f.sha256 = s.sha256
+    """),
+    # Repeats within the import keep their first row
+    ('duplicate', """
+        DELETE FROM file_import
+        WHERE row_id IN (
+            SELECT row_id FROM (
+                SELECT row_id, row_number() OVER (PARTITION BY multihash ORDER BY row_id) AS n
+                FROM file_import
+                WHERE multihash IS NOT NULL
+            ) d
+            WHERE n > 1
+        )
+    """),
+    ('duplicate', """
+        DELETE FROM file_import
+        WHERE row_id IN (
+            SELECT row_id FROM (
+                SELECT row_id, row_number() OVER (PARTITION BY sha256 ORDER BY row_id) AS n
+                FROM file_import
+                WHERE sha256 IS NOT NULL
+            ) d
+            WHERE n > 1
+        )
+    """),
+]
+
+# Inserts the staged rows and bumps the usage counters by status in the same statement
+INSERT_FILES = """
+    WITH inserted AS (
+        INSERT INTO file (filename, filepath, sha256, description, file_size, user_id,
+                          ipfs_status, multihash, upload_date)
+        SELECT left(filename, 255),
+               CASE WHEN source IS NOT NULL AND NOT known THEN sha256 END,
+               sha256, COALESCE(description, ''), file_size, :user_id,
+               ipfs_status, multihash, now()
+        FROM file_import
+        ORDER BY row_id
+        ON CONFLICT (user_id, multihash) DO NOTHING
+        RETURNING ipfs_status, file_size
+    ), usage AS (
+        INSERT INTO user_usage (user_id, status, total_bytes, file_count)
+        SELECT :user_id, ipfs_status, SUM(file_size), COUNT(*)
+        FROM inserted
+        GROUP BY ipfs_status
+        ON CONFLICT (user_id, status) DO UPDATE
+        SET total_bytes = user_usage.total_bytes + EXCLUDED.total_bytes,
+            file_count = user_usage.file_count + EXCLUDED.file_count
+    )
+    SELECT COUNT(*) FROM inserted
+"""
+
+def copy_csv(conn, f):
+    """COPY a CSV manifest whose header names its columns into file_import"""
+    header = next(csv.reader([f.readline()]), [])
+    columns = [name.strip().lower() for name in header]
+    if not set(STAGING_COLUMNS) & set(columns):
+        raise ValueError(f"CSV header must include some of: {', '.join(STAGING_COLUMNS)}")
+    # Load every column as text, then keep the ones the file table has
+    raw_columns = ', '.join(f'c{i} TEXT' for i in range(len(columns)))
+    conn.execute(db.text(f'CREATE TEMP TABLE file_import_raw ({raw_columns}) ON COMMIT DROP'))
+    cursor = conn.connection.driver_connection.cursor()
+    cursor.copy_expert('COPY file_import_raw FROM STDIN WITH (FORMAT csv)', f)
+
+    def column(name, cast=''):
+        return f"NULLIF(c{columns.index(name)}, ''){cast}" if name in columns else 'NULL'
+    conn.execute(db.text(f"""
+        INSERT INTO file_import (filename, multihash, sha256, description, file_size)
+        SELECT {column('filename')}, {column('multihash')}, lower({column('sha256')}),
+               {column('description')}, {column('file_size', '::bigint')}
+        FROM file_import_raw
+    """))
+
+def copy_ndjson(conn, f):
+    """COPY an NDJSON manifest into file_import, one JSON document per line"""
+    conn.execute(db.text('CREATE TEMP TABLE file_import_raw (doc JSONB) ON COMMIT DROP'))
+    cursor = conn.connection.driver_connection.cursor()
+    # Control characters never appear raw in JSON, so each line loads as one unquoted field
+    cursor.copy_expert("COPY file_import_raw FROM STDIN WITH (FORMAT csv, QUOTE e'\\x01', DELIMITER e'\\x02')", f)
+    conn.execute(db.text("""
+        INSERT INTO file_import (filename, multihash, sha256, description, file_size)
+        SELECT doc->>'filename', NULLIF(doc->>'multihash', ''), lower(NULLIF(doc->>'sha256', '')),
+               doc->>'description', COALESCE(doc->>'file_size', doc->>'fileSize')::bigint
+        FROM file_import_raw
+        WHERE doc IS NOT NULL
+    """))
+
+def hash_file(path):
+    """Return (path, sha256 hex digest, size), or (path, None, None) if unreadable"""
+    sha256 = hashlib.sha256()
+    size = 0
+    try:
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(UPLOAD_CHUNK_BYTES), b''):
+                sha256.update(chunk)
+                size += len(chunk)
+    except OSError:
+        return path, None, None
+    return path, sha256.hexdigest(), size
+
+def walk_files(root):
+    for dirpath, _, filenames in os.walk(root):
+        for name in sorted(filenames):
+            path = os.path.join(dirpath, name)
+            if os.path.isfile(path) and not os.path.islink(path):
+                yield path
+
+def hash_tree(root, out, processes=None):
+    """Hash every file under root in parallel, writing staging CSV rows to out; returns (files, unreadable)"""
+    writer = csv.writer(out)
+    hashed = unreadable = 0
+    with Pool(processes) as pool:
+        for path, sha256, size in pool.imap_unordered(hash_file, walk_files(root), HASH_CHUNKSIZE):
+            if sha256 is None:
+                unreadable += 1
+                continue
+            writer.writerow([os.path.relpath(path, root), sha256, size, path])
+            hashed += 1
+    return hashed, unreadable
+
+def copy_upload(source, sha256):
+    """Copy content into the upload folder under its digest; returns False if it no longer matches
+
+    A hard link would share the inode with a file its owner can still change,
+    so the content is copied, and hashed again on the way in case it changed
+    since hash_tree read it.
+    """
+    target = os.path.join(app.config['UPLOAD_FOLDER'], sha256)
+    if os.path.exists(target):
+        # Refresh its ctime so the processor keeps it until the import commits
+        os.utime(target)
+        return True
+    fd, partial_path = tempfile.mkstemp(dir=app.config['UPLOAD_FOLDER'], suffix='.part')
+    try:
+        digest = hashlib.sha256()
+        with os.fdopen(fd, 'wb') as out, open(source, 'rb') as f:
+            for chunk in iter(lambda: f.read(UPLOAD_CHUNK_BYTES), b''):
+                digest.update(chunk)
+                out.write(chunk)
+        if digest.hexdigest() != sha256:
+            os.remove(partial_path)
+            return False
+        os.replace(partial_path, target)
+    except OSError:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+        return False
+    return True
+
+def merge(conn, user_id):
+    """Merge file_import into the file table; returns (inserted, skipped counts by reason)"""
+    skipped = {}
+    for reason, statement in MERGE_STEPS:
+        result = conn.execute(db.text(statement), {'user_id': user_id})
+        if result.rowcount and reason != 'known':
+            skipped[reason] = skipped.get(reason, 0) + result.rowcount
+
+    # The processor reads new content from the upload folder once the rows commit
+    sources = conn.execute(db.text("""
+        SELECT source, sha256 FROM file_import WHERE source IS NOT NULL AND NOT known
+    """).execution_options(stream_results=True, yield_per=10000))
+    changed = [source for source, sha256 in sources if not copy_upload(source, sha256)]
+    if changed:
+        conn.execute(db.text('DELETE FROM file_import WHERE source = ANY(:changed)'), {'changed': changed})
+        skipped['changed'] = len(changed)
+
+    inserted = conn.execute(db.text(INSERT_FILES), {'user_id': user_id}).scalar()
+    # Workers add the new rows to their duplicate filters from the file table
+    conn.execute(db.text('SELECT pg_notify(:channel, :payload)'),
+                 {'channel': CID_FILTER_CHANNEL, 'payload': CID_FILTER_CATCH_UP})
+    return inserted, skipped
+
+def import_manifest(user_id, path):
+    copy = copy_ndjson if path.endswith(('.ndjson', '.jsonl')) else copy_csv
+    with db.engine.begin() as conn, open(path, newline='') as f:
+        conn.execute(db.text(CREATE_STAGING))
+        copy(conn, f)
+        return merge(conn, user_id)
+
+def import_directory(user_id, root, processes=None):
+    os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+    with tempfile.TemporaryFile('w+', newline='') as rows:
+        hashed, unreadable = hash_tree(root, rows, processes)
+        print(f"Hashed {hashed} files ({unreadable} unreadable)")
+        rows.seek(0)
+        with db.engine.begin() as conn:
+            conn.execute(db.text(CREATE_STAGING))
+            cursor = conn.connection.driver_connection.cursor()
+            cursor.copy_expert('COPY file_import (filename, sha256, file_size, source) FROM STDIN WITH (FORMAT csv)', rows)
+            return merge(conn, user_id)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Bulk import files into the catalog')
+    modes = parser.add_subparsers(dest='mode', required=True)
+    manifest = modes.add_parser('manifest', help='Register CIDs from a CSV or NDJSON manifest')
+    manifest.add_argument('username')
+    manifest.add_argument('path')
+    directory = modes.add_parser('directory', help='Hash a directory tree and queue it for IPFS')
+    directory.add_argument('username')
+    directory.add_argument('root')
+    directory.add_argument('--processes', type=int, default=None, help='Hashing processes (default: CPU count)')
+    args = parser.parse_args(argv)
+
+    with app.app_context():
+        if db.engine.dialect.name != 'postgresql':
+            sys.exit('Bulk import requires PostgreSQL')
+        user = User.query.filter_by(username=args.username).first()
+        if user is None:
+            sys.exit(f'Unknown user: {args.username}')
+
+        if args.mode == 'manifest':
+            inserted, skipped = import_manifest(user.id, args.path)
+        else:
+            inserted, skipped = import_directory(user.id, args.root, args.processes)
+
+    details = ', '.join(f'{count} {reason}' for reason, count in skipped.items())
+    print(f"Imported {inserted} files" + (f", skipped {details}" if details else ''))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+"""Pin-agreement matcher service.
+
+Loads open pin requests and offers into an in-memory order book, matches
+them once per tick and writes the resulting agreements back to the
+database. Run a single instance; the book is not shared between processes.
+"""
+import os
+import time
+import logging
+from app import app, db, PinRequest, PinOffer, PinAgreement
+from matching import OrderBook, Offer, Request
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+MATCH_INTERVAL_SECONDS = float(os.getenv('MATCH_INTERVAL_SECONDS', 1))
+
+class Matcher:
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        """Drop the in-memory book so the next tick reloads every open order"""
+        self.book = OrderBook()
+        self.requests = {}  # id -> (engine request, total replicas)
+        self.offers = {}  # id -> engine offer
+
+    @staticmethod
+    def _unloaded(model, loaded):
+        """Open orders missing from the book; ids are compared rather than tracked with a
+        high-water mark, because ids are assigned before commit and can become visible out of order"""
+        open_ids = db.session.scalars(db.select(model.id).where(model.status == 'open'))
+        new_ids = sorted(set(open_ids) - loaded.keys())
+        if not new_ids:
+            return []
+        return model.query.filter(model.id.in_(new_ids)).order_by(model.id).all()
+
+    def load_new_orders(self):
+        """Queue open orders that are not in the book yet"""
+        for row in self._unloaded(PinOffer, self.offers):
+            offer = Offer(row.id, row.user_id, row.capacity_remaining, row.price, row.duration_days)
+            self.offers[row.id] = offer
+            self.book.submit_offer(offer)
+
+        rows = self._unloaded(PinRequest, self.requests)
+        # Partly filled requests must not land on an offer they already hold
+        used = {}
+        if rows:
+            agreements = db.session.execute(
+                db.select(PinAgreement.request_id, PinAgreement.offer_id)
+                .where(PinAgreement.request_id.in_([row.id for row in rows])))
+            for request_id, offer_id in agreements:
+                used.setdefault(request_id, set()).add(offer_id)
+
+        for row in rows:
+            pin_request = Request(row.id, row.user_id, row.size, row.replicas - row.replicas_filled,
+                                  row.price, row.duration_days, used.get(row.id, set()))
+            self.requests[row.id] = (pin_request, row.replicas)
+            self.book.submit_request(pin_request)
+
+    def persist(self, matches):
+        """Write agreements and the new order state in one transaction"""
+        db.session.execute(db.insert(PinAgreement), [{
+            'request_id': m.request_id,
+            'offer_id': m.offer_id,
+            'price': m.price,
+            'size': m.size,
+            'duration_days': m.duration
+        } for m in matches])
+
+        request_rows = []
+        for request_id in {m.request_id for m in matches}:
+            pin_request, total = self.requests[request_id]
+            filled = pin_request.replicas == 0
+            request_rows.append({
+                'id': request_id,
+                'replicas_filled': total - pin_request.replicas,
+                'status': 'filled' if filled else 'open'
+            })
+            if filled:
+                del self.requests[request_id]
+        db.session.execute(db.update(PinRequest), request_rows)
+
+        offer_rows = []
+        for offer_id in {m.offer_id for m in matches}:
+            offer = self.offers[offer_id]
+            filled = offer.capacity == 0
+            offer_rows.append({
+                'id': offer_id,
+                'capacity_remaining': offer.capacity,
+                'status': 'filled' if filled else 'open'
+            })
+            if filled:
+                del self.offers[offer_id]
+        db.session.execute(db.update(PinOffer), offer_rows)
+
+        db.session.commit()
+
+    def tick(self):
+        """Load new orders, run one match batch and persist the result"""
+        try:
+            self.load_new_orders()
+            matches = self.book.match()
+            if matches:
+                self.persist(matches)
+                logger.info(f"Created {len(matches)} pin agreements")
+            return matches
+        except Exception as e:
+            logger.error(f"Error in matcher tick, reloading order book: {e}")
+            db.session.rollback()
+            self.reset()
+            return []
+        finally:
+            # Release the connection and identity map between ticks
+            db.session.remove()
+
+def main():
+    logger.info("Starting pin-agreement matcher")
+    matcher = Matcher()
+    with app.app_context():
+        while True:
+            matcher.tick()
+            time.sleep(MATCH_INTERVAL_SECONDS)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+"""In-memory order book that pairs pin requests with pin offers.
+
+Offers are indexed by price level and, within a level, by remaining
+capacity, so a request finds the cheapest offers that can hold it with a
+couple of bisects instead of a scan over the whole book. Orders are
+queued as they arrive and matched in batches by ``OrderBook.match``.
+"""
+from bisect import bisect_left, insort
+from dataclasses import dataclass, field
+from heapq import merge
+
+
+@dataclass(slots=True)
+class Offer:
+    id: int
+    owner: int
+    capacity: int  # Remaining bytes
+    price: int  # Asking price per GB-month
+    duration: int  # Longest agreement in days
+
+
+@dataclass(slots=True)
+class Request:
+    id: int
+    owner: int
+    size: int  # Bytes per replica
+    replicas: int  # Replicas still wanted
+    price: int  # Maximum price per GB-month
+    duration: int  # Days
+    used: set = field(default_factory=set)  # Offers already holding a replica
+    seq: int = 0
+
+
+@dataclass(slots=True)
+class Match:
+    request_id: int
+    offer_id: int
+    price: int
+    size: int
+    duration: int
+
+
+class OrderBook:
+    def __init__(self):
+        self._offers = {}
+        self._requests = {}
+        # Sorted price levels, each mapping to a sorted list of (capacity, offer_id)
+        self._prices = []
+        self._levels = {}
+        # Unfilled requests, sorted best (highest) price first, then arrival order
+        self._resting = []
+        self._incoming_offers = []
+        self._incoming_requests = []
+        self._seq = 0
+
+    def __len__(self):
+        return len(self._offers) + len(self._requests)
+
+    def submit_offer(self, offer):
+        """Queue an offer for the next match pass"""
+        self._incoming_offers.append(offer)
+
+    def submit_request(self, request):
+        """Queue a request for the next match pass"""
+        self._seq += 1
+        request.seq = self._seq
+        self._incoming_requests.append(request)
+
+    def _index(self, offer):
+        level = self._levels.get(offer.price)
+        if level is None:
+            level = self._levels[offer.price] = []
+            insort(self._prices, offer.price)
+        insort(level, (offer.capacity, offer.id))
+
+    def _unindex(self, offer):
+        level = self._levels[offer.price]
+        del level[bisect_left(level, (offer.capacity, offer.id))]
+        if not level:
+            del self._levels[offer.price]
+            del self._prices[bisect_left(self._prices, offer.price)]
+
+    def _fill(self, request, matches):
+        """Place as many replicas of request as possible, each on a distinct offer,
+        including offers that took a replica in earlier passes"""
+        picked = []
+        for price in self._prices:
+            if price > request.price:
+                break
+            level = self._levels[price]
+            # Smallest offers that still fit come first, keeping large offers free
+            for i in range(bisect_left(level, (request.size,)), len(level)):
+                offer = self._offers[level[i][1]]
+                if (offer.duration >= request.duration and offer.owner != request.owner
+                        and offer.id not in request.used):
+                    picked.append(offer)
+                    if len(picked) == request.replicas:
+                        break
+            if len(picked) == request.replicas:
+                break
+
+        for offer in picked:
+            self._unindex(offer)
+            offer.capacity -= request.size
+            if offer.capacity > 0:
+                self._index(offer)
+            else:
+                del self._offers[offer.id]
+            request.used.add(offer.id)
+            matches.append(Match(request.id, offer.id, offer.price, request.size, request.duration))
+        request.replicas -= len(picked)
+        return request.replicas == 0
+
+    def match(self):
+        """Run one batch: index queued offers, then fill requests best price first"""
+        matches = []
+        new_offers = bool(self._incoming_offers)
+        for offer in self._incoming_offers:
+            if offer.capacity > 0:
+                self._offers[offer.id] = offer
+                self._index(offer)
+        self._incoming_offers = []
+
+        incoming = sorted((-r.price, r.seq, r) for r in self._incoming_requests)
+        self._incoming_requests = []
+        for _, _, request in incoming:
+            self._requests[request.id] = request
+
+        # Resting requests only need another look when new capacity arrived
+        if new_offers:
+            candidates = merge(self._resting, ((p, s, r.id) for p, s, r in incoming))
+            self._resting = []
+        else:
+            candidates = [(p, s, r.id) for p, s, r in incoming]
+
+        for key in candidates:
+            request = self._requests[key[2]]
+            if self._prices and request.price >= self._prices[0] and self._fill(request, matches):
+                del self._requests[request.id]
+            else:
+                insort(self._resting, key)
+        return matches
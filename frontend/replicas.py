@@ -0,0 +1,115 @@
+"""Read-replica routing for read-heavy views.
+
+Views marked with read_only send their queries to a healthy replica, picked
+round-robin; everything else, including any flush, stays on the primary.
+A background thread checks each replica and takes it out of rotation while
+it is unreachable or lagging. After a user writes, their reads stick to the
+primary for a short window so they always see their own changes.
+"""
+import time
+import logging
+import threading
+from functools import wraps
+from flask import g, session, current_app
+from flask_sqlalchemy.session import Session
+from sqlalchemy import create_engine, text
+
+logger = logging.getLogger(__name__)
+
+# Seconds of replay lag on a Postgres standby: 0 when it has applied everything it
+# received, NULL when it is not streaming from the primary (received and replayed
+# positions also match on a standby that lost its connection). Reading the WAL
+# receiver status needs superuser or pg_read_all_stats.
+_PG_LAG_SQL = text("""
+    SELECT CASE WHEN NOT EXISTS (SELECT 1 FROM pg_stat_wal_receiver WHERE status = 'streaming') THEN NULL
+                WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+                ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+           END
+""")
+
+class ReplicaPool:
+    """Round-robin over the replicas that passed their last health check"""
+
+    def __init__(self, engines, max_lag=5.0):
+        self.engines = list(engines)
+        self.max_lag = max_lag
+        self.healthy = list(self.engines)
+        self.next = 0
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_urls(cls, urls, max_lag=5.0):
+        return cls([create_engine(url, pool_pre_ping=True) for url in urls], max_lag)
+
+    def pick(self):
+        """Return the next healthy replica engine, or None to use the primary"""
+        with self.lock:
+            if not self.healthy:
+                return None
+            engine = self.healthy[self.next % len(self.healthy)]
+            self.next += 1
+            return engine
+
+    def _lag(self, engine):
+        """Seconds behind the primary, or None if the replica is not following it"""
+        with engine.connect() as conn:
+            if engine.dialect.name == 'postgresql':
+                lag = conn.execute(_PG_LAG_SQL).scalar()
+                return None if lag is None else float(lag)
+            conn.execute(text('SELECT 1'))
+            return 0.0
+
+    def check(self):
+        """Probe every replica and keep only the reachable ones within max_lag"""
+        healthy = []
+        for engine in self.engines:
+            try:
+                lag = self._lag(engine)
+            except Exception as e:
+                logger.warning(f"Replica {engine.url.host} unreachable: {e}")
+                continue
+            if lag is None:
+                logger.warning(f"Replica {engine.url.host} is not streaming from the primary, skipping it")
+                continue
+            if lag > self.max_lag:
+                logger.warning(f"Replica {engine.url.host} is {lag:.1f}s behind, skipping it")
+                continue
+            healthy.append(engine)
+        with self.lock:
+            self.healthy = healthy
+
+    def start(self, interval):
+        """Check the replicas now and every interval seconds; reads use the primary until the first check"""
+        with self.lock:
+            self.healthy = []
+
+        def loop():
+            while True:
+                self.check()
+                time.sleep(interval)
+        threading.Thread(target=loop, daemon=True).start()
+
+class RoutingSession(Session):
+    """Session that reads from the request's replica inside read_only views"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and g and g.get('replica') is not None:
+            return g.replica
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+def read_only(view):
+    """Serve a view's queries from one replica unless the user wrote recently"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        pool = current_app.extensions.get('replicas')
+        sticky = session.get('primary_until', 0) >= time.time()
+        g.replica = pool.pick() if pool and not sticky else None
+        try:
+            return view(*args, **kwargs)
+        finally:
+            g.replica = None
+    return wrapper
+
+def mark_write():
+    """Pin the current user's reads to the primary until replicas have caught up"""
+    session['primary_until'] = time.time() + current_app.config['REPLICA_STICKY_SECONDS']
@@ -0,0 +1,123 @@
+// Hashes a File in slices so large uploads never sit in memory at once.
+// Posts {progress} while reading and finally {sha256}. No CID is derived
+// here: the daemon's CID depends on its chunking and DAG layout.
+
+const CHUNK_BYTES = 4 * 1024 * 1024;
+
+const K = new Uint32Array([
+    0x428a2f98, 0x71374491, 0xb5c0fbcf, 0xe9b5dba5, 0x3956c25b, 0x59f111f1, 0x923f82a4, 0xab1c5ed5,
+    0xd807aa98, 0x12835b01, 0x243185be, 0x550c7dc3, 0x72be5d74, 0x80deb1fe, 0x9bdc06a7, 0xc19bf174,
+    0xe49b69c1, 0xefbe4786, 0x0fc19dc6, 0x240ca1cc, 0x2de92c6f, 0x4a7484aa, 0x5cb0a9dc, 0x76f988da,
+    0x983e5152, 0xa831c66d, 0xb00327c8, 0xbf597fc7, 0xc6e00bf3, 0xd5a79147, 0x06ca6351, 0x14292967,
+    0x27b70a85, 0x2e1b2138, 0x4d2c6dfc, 0x53380d13, 0x650a7354, 0x766a0abb, 0x81c2c92e, 0x92722c85,
+    0xa2bfe8a1, 0xa81a664b, 0xc24b8b70, 0xc76c51a3, 0xd192e819, 0xd6990624, 0xf40e3585, 0x106aa070,
+    0x19a4c116, 0x1e376c08, 0x2748774c, 0x34b0bcb5, 0x391c0cb3, 0x4ed8aa4a, 0x5b9cca4f, 0x682e6ff3,
+    0x748f82ee, 0x78a5636f, 0x84c87814, 0x8cc70208, 0x90befffa, 0xa4506ceb, 0xbef9a3f7, 0xc67178f2
+]);
+
+// Incremental SHA-256; crypto.subtle.digest only accepts the whole input at once
+class Sha256 {
+    constructor() {
+        this.h = new Uint32Array([
+            0x6a09e667, 0xbb67ae85, 0x3c6ef372, 0xa54ff53a, 0x510e527f, 0x9b05688c, 0x1f83d9ab, 0x5be0cd19
+        ]);
+        this.w = new Uint32Array(64);
+        this.buffer = new Uint8Array(64);
+        this.buffered = 0;
+        this.length = 0;
+    }
+
+    update(data) {
+        this.length += data.length;
+        let offset = 0;
+        if (this.buffered) {
+            const take = Math.min(64 - this.buffered, data.length);
+            this.buffer.set(data.subarray(0, take), this.buffered);
+            this.buffered += take;
+            offset = take;
+            if (this.buffered < 64) {
+                return;
+            }
+            this.block(this.buffer, 0);
+            this.buffered = 0;
+        }
+        for (; offset + 64 <= data.length; offset += 64) {
+            this.block(data, offset);
+        }
+        if (offset < data.length) {
+            this.buffer.set(data.subarray(offset));
+            this.buffered = data.length - offset;
+        }
+    }
+
+    block(data, offset) {
+        const w = this.w;
+        for (let i = 0; i < 16; i++) {
+            const j = offset + i * 4;
+            w[i] = (data[j] << 24) | (data[j + 1] << 16) | (data[j + 2] << 8) | data[j + 3];
+        }
+        for (let i = 16; i < 64; i++) {
+            const x = w[i - 15];
+            const y = w[i - 2];
+            const s0 = ((x >>> 7) | (x << 25)) ^ ((x >>> 18) | (x << 14)) ^ (x >>> 3);
+            const s1 = ((y >>> 17) | (y << 15)) ^ ((y >>> 19) | (y << 13)) ^ (y >>> 10);
+            w[i] = w[i - 16] + s0 + w[i - 7] + s1;
+        }
+
+        let [a, b, c, d, e, f, g, h] = this.h;
+        for (let i = 0; i < 64; i++) {
+            const S1 = ((e >>> 6) | (e << 26)) ^ ((e >>> 11) | (e << 21)) ^ ((e >>> 25) | (e << 7));
+            const ch = (e & f) ^ (~e & g);
+            const t1 = (h + S1 + ch + K[i] + w[i]) | 0;
+            const S0 = ((a >>> 2) | (a << 30)) ^ ((a >>> 13) | (a << 19)) ^ ((a >>> 22) | (a << 10));
+            const maj = (a & b) ^ (a & c) ^ (b & c);
+            h = g;
+            g = f;
+            f = e;
+            e = (d + t1) | 0;
+            d = c;
+            c = b;
+            b = a;
+            a = (t1 + S0 + maj) | 0;
+        }
+        this.h[0] += a;
+        this.h[1] += b;
+        this.h[2] += c;
+        this.h[3] += d;
+        this.h[4] += e;
+        this.h[5] += f;
+        this.h[6] += g;
+        this.h[7] += h;
+    }
+
+    digest() {
+        const bits = this.length * 8;
+        const padding = new Uint8Array((this.buffered < 56 ? 64 : 128) - this.buffered);
+        padding[0] = 0x80;
+        const view = new DataView(padding.buffer);
+        view.setUint32(padding.length - 8, Math.floor(bits / 0x100000000));
+        view.setUint32(padding.length - 4, bits >>> 0);
+        this.update(padding);
+
+        const out = new Uint8Array(32);
+        const outView = new DataView(out.buffer);
+        for (let i = 0; i < 8; i++) {
+            outView.setUint32(i * 4, this.h[i]);
+        }
+        return out;
+    }
+}
+
+function toHex(bytes) {
+    return Array.from(bytes, (byte) => byte.toString(16).padStart(2, '0')).join('');
+}
+
+self.onmessage = async ({data: file}) => {
+    const hash = new Sha256();
+    for (let offset = 0; offset < file.size; offset += CHUNK_BYTES) {
+        const chunk = await file.slice(offset, offset + CHUNK_BYTES).arrayBuffer();
+        hash.update(new Uint8Array(chunk));
+        self.postMessage({progress: Math.min(offset + CHUNK_BYTES, file.size) / file.size});
+    }
+    self.postMessage({sha256: toHex(hash.digest())});
+};
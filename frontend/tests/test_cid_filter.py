@@ -0,0 +1,107 @@
+import os
+import queue
+import threading
+import pytest
+from sqlalchemy import create_engine, text
+import app as app_module
+from app import db, User, File
+from cid_filter import BloomFilter, listen
+
+def test_bloom_filter_membership():
+    """Test that added keys are always found and few others are"""
+    bloom = BloomFilter(1000)
+    keys = [f'Qm{i}' for i in range(1000)]
+    for key in keys:
+        bloom.add(key)
+
+    assert all(key in bloom for key in keys)
+    false_positives = sum(f'bafy{i}' in bloom for i in range(10000))
+    assert false_positives < 300
+    assert not bloom.full
+
+def test_bloom_filter_snapshot(tmp_path):
+    """Test that a saved filter loads back with the same contents"""
+    bloom = BloomFilter(100)
+    bloom.add('QmSaved')
+    bloom.last_id = 42
+    path = tmp_path / 'filter.bin'
+    bloom.save(path)
+
+    loaded = BloomFilter.load(path)
+    assert 'QmSaved' in loaded
+    assert loaded.last_id == 42
+    assert loaded.count == 1
+    assert BloomFilter.load(tmp_path / 'missing.bin') is None
+
+def test_inserted_files_are_remembered(app):
+    """Test that new file rows are added to the filter"""
+    with app.app_context():
+        user = User(username='filteruser', email='filter@example.com')
+        db.session.add(user)
+        db.session.commit()
+
+        db.session.add(File(filename='f.txt', file_size=1, user_id=user.id, multihash='QmRemembered'))
+        db.session.commit()
+        assert app_module.maybe_known('QmRemembered')
+
+def test_unique_constraint_guards_filter_misses(client, app, monkeypatch):
+    """Test that a duplicate slipping past the filter is still rejected"""
+    with app.app_context():
+        user = User(username='filteruser', email='filter@example.com')
+        user.set_password('testpass123')
+        db.session.add(user)
+        db.session.commit()
+
+    client.post('/login', data={'username': 'filteruser', 'password': 'testpass123'})
+    payload = {'multihash': 'QmTwice', 'filename': 'twice.txt', 'fileSize': 5}
+    assert client.post('/upload', json=payload).status_code == 200
+
+    monkeypatch.setattr(app_module, 'maybe_known', lambda key: False)
+    response = client.post('/upload', json=payload)
+    assert response.status_code == 400
+    assert b'File with this hash already exists' in response.data
+
+def test_notified_keys_refresh_snapshot(app, tmp_path, monkeypatch):
+    """Test that keys arriving by notification reach the snapshot, at most once per interval"""
+    path = tmp_path / 'filter.bin'
+    monkeypatch.setitem(app.config, 'CID_FILTER_SNAPSHOT', str(path))
+    monkeypatch.setitem(app.config, 'CID_FILTER_SAVE_SECONDS', 300)
+    monkeypatch.setattr(app_module, 'cid_filter_saved', 0.0)
+    bloom = BloomFilter(100)
+
+    app_module._on_cid_payload(bloom, 'bafyFromUpdate')
+    assert 'bafyFromUpdate' in BloomFilter.load(path)
+
+    app_module._on_cid_payload(bloom, 'bafyTooSoon')
+    assert 'bafyTooSoon' in bloom
+    assert BloomFilter.load(path).count == 1
+
+def test_catch_up_payload_rescans(app, tmp_path, monkeypatch):
+    """Test that the catch-up payload, also run when the listener connects, adds new rows"""
+    monkeypatch.setitem(app.config, 'CID_FILTER_SNAPSHOT', str(tmp_path / 'filter.bin'))
+    with app.app_context():
+        user = User(username='filteruser', email='filter@example.com')
+        db.session.add(user)
+        db.session.commit()
+        db.session.add(File(filename='f.txt', file_size=1, user_id=user.id, multihash='QmImported'))
+        db.session.commit()
+
+    bloom = BloomFilter(100)
+    app_module._on_cid_payload(bloom, app_module.CID_FILTER_CATCH_UP)
+    assert 'QmImported' in bloom
+    assert BloomFilter.load(tmp_path / 'filter.bin').last_id == bloom.last_id > 0
+
+def test_listen_delivers_notifications():
+    """Test that the listener connects, reports that LISTEN is in effect and delivers payloads"""
+    url = os.getenv('TEST_DATABASE_URL')
+    if not url:
+        pytest.skip('TEST_DATABASE_URL is not set')
+    engine = create_engine(url)
+    events = queue.Queue()
+    threading.Thread(target=listen, args=(engine, 'cid_filter_test', events.put),
+                     kwargs={'on_listen': lambda: events.put('listening')}, daemon=True).start()
+    assert events.get(timeout=10) == 'listening'
+    with engine.begin() as conn:
+        conn.execute(text("SELECT pg_notify('cid_filter_test', 'QmNotified')"))
+    assert events.get(timeout=10) == 'QmNotified'
+    engine.dispose()
@@ -0,0 +1,56 @@
+import pytest
+from app import db, User, File, FileTombstone, record_usage
+
+@pytest.fixture
+def owner(app):
+    with app.app_context():
+        for name in ['owner', 'other']:
+            user = User(username=name, email=f'{name}@example.com')
+            user.set_password('testpass123')
+            db.session.add(user)
+        db.session.commit()
+        return User.query.filter_by(username='owner').first().id
+
+def add_file(user_id, status, multihash='QmDeleted'):
+    file = File(filename='gone.txt', filepath='gone.txt', file_size=100, user_id=user_id,
+                ipfs_status=status, multihash=multihash, sha256='ab' * 32)
+    db.session.add(file)
+    record_usage(user_id, status, 100)
+    db.session.commit()
+    return file.id
+
+def login(client, username):
+    client.get('/logout')
+    client.post('/login', data={'username': username, 'password': 'testpass123'})
+
+def test_delete_writes_tombstone(client, app, owner):
+    """Test that deleting a file leaves a tombstone and releases its usage"""
+    file_id = add_file(owner, 'completed')
+    login(client, 'owner')
+    response = client.post(f'/files/{file_id}/delete', follow_redirects=True)
+    assert b'Deleted gone.txt' in response.data
+
+    with app.app_context():
+        assert db.session.get(File, file_id) is None
+        tombstone = FileTombstone.query.one()
+        assert (tombstone.user_id, tombstone.multihash, tombstone.filepath) == (owner, 'QmDeleted', 'gone.txt')
+        assert db.session.get(User, owner).usage_totals() == (0, 0)
+
+def test_delete_refuses_processing(client, app, owner):
+    """Test that files the processor is adding cannot be deleted"""
+    file_id = add_file(owner, 'processing')
+    login(client, 'owner')
+    response = client.post(f'/files/{file_id}/delete', follow_redirects=True)
+    assert b'delete it once processing finishes' in response.data
+
+    with app.app_context():
+        assert db.session.get(File, file_id) is not None
+        assert FileTombstone.query.count() == 0
+
+def test_delete_other_users_file(client, app, owner):
+    """Test that users can only delete their own files"""
+    file_id = add_file(owner, 'completed')
+    login(client, 'other')
+    assert client.post(f'/files/{file_id}/delete').status_code == 404
+    with app.app_context():
+        assert db.session.get(File, file_id) is not None
@@ -0,0 +1,70 @@
+import pytest
+import csv
+import gzip
+import json
+from datetime import datetime
+from app import db, User, File
+
+@pytest.fixture
+def catalog(client, app):
+    """Create two users with files and log one of them in"""
+    with app.app_context():
+        alice = User(username='alice', email='alice@example.com')
+        alice.set_password('testpass123')
+        bob = User(username='bob', email='bob@example.com')
+        bob.set_password('testpass123')
+        db.session.add_all([alice, bob])
+        db.session.commit()
+
+        db.session.add_all([
+            File(filename='a1.txt', filepath='a1.txt', file_size=10, user_id=alice.id,
+                 ipfs_status='completed', multihash='QmA1', upload_date=datetime(2025, 1, 1)),
+            File(filename='a2.txt', filepath='a2.txt', file_size=20, user_id=alice.id,
+                 ipfs_status='pending', upload_date=datetime(2025, 2, 1)),
+            File(filename='b1.txt', filepath='b1.txt', file_size=30, user_id=bob.id,
+                 ipfs_status='completed', multihash='QmB1', upload_date=datetime(2025, 3, 1)),
+        ])
+        db.session.commit()
+
+    client.post('/login', data={'username': 'alice', 'password': 'testpass123'})
+
+def test_export_requires_login(client):
+    """Test that exports require login"""
+    response = client.get('/api/export/ndjson')
+    assert response.status_code == 302
+
+def test_export_ndjson(client, catalog):
+    """Test NDJSON export of the whole catalog"""
+    response = client.get('/api/export/ndjson')
+    assert response.status_code == 200
+    assert response.mimetype == 'application/x-ndjson'
+    records = [json.loads(line) for line in response.data.decode().splitlines()]
+    assert [r['filename'] for r in records] == ['a1.txt', 'a2.txt', 'b1.txt']
+    assert records[0]['username'] == 'alice'
+    assert records[0]['upload_date'] == '2025-01-01T00:00:00'
+
+def test_export_csv_filters(client, catalog):
+    """Test CSV export filtered by user, status and date range"""
+    response = client.get('/api/export/csv?user=alice&status=completed')
+    rows = list(csv.DictReader(response.data.decode().splitlines()))
+    assert [r['filename'] for r in rows] == ['a1.txt']
+
+    response = client.get('/api/export/csv?since=2025-01-15&until=2025-03-01')
+    rows = list(csv.DictReader(response.data.decode().splitlines()))
+    assert [r['filename'] for r in rows] == ['a2.txt']
+
+def test_export_gzip(client, catalog):
+    """Test gzip output for explicit downloads and Accept-Encoding"""
+    response = client.get('/api/export/ndjson?gzip=1')
+    assert response.mimetype == 'application/gzip'
+    assert 'files.ndjson.gz' in response.headers['Content-Disposition']
+    assert len(gzip.decompress(response.data).decode().splitlines()) == 3
+
+    response = client.get('/api/export/csv', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(response.data).decode().startswith('id,username')
+
+def test_export_bad_arguments(client, catalog):
+    """Test that unknown formats and bad dates are rejected"""
+    assert client.get('/api/export/xml').status_code == 400
+    assert client.get('/api/export/csv?since=yesterday').status_code == 400
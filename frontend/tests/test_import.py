@@ -0,0 +1,150 @@
+import csv
+import io
+import os
+import hashlib
+import pytest
+from sqlalchemy import create_engine, text
+from app import db, User, File
+from import_files import CREATE_STAGING, hash_tree, copy_upload, copy_csv, merge, main
+
+def test_hash_tree(tmp_path):
+    """Test that every regular file under the root is hashed with its size and path"""
+    root = tmp_path / 'tree'
+    (root / 'nested').mkdir(parents=True)
+    (root / 'a.txt').write_bytes(b'alpha')
+    (root / 'nested' / 'b.txt').write_bytes(b'beta content')
+    (root / 'nested' / 'copy.txt').write_bytes(b'alpha')
+    os.symlink(root / 'a.txt', root / 'link.txt')
+
+    out = io.StringIO()
+    assert hash_tree(str(root), out, processes=2) == (3, 0)
+    rows = sorted(csv.reader(io.StringIO(out.getvalue())))
+    assert rows == [
+        ['a.txt', hashlib.sha256(b'alpha').hexdigest(), '5', str(root / 'a.txt')],
+        [os.path.join('nested', 'b.txt'), hashlib.sha256(b'beta content').hexdigest(), '12',
+         str(root / 'nested' / 'b.txt')],
+        [os.path.join('nested', 'copy.txt'), hashlib.sha256(b'alpha').hexdigest(), '5',
+         str(root / 'nested' / 'copy.txt')],
+    ]
+
+def test_copy_upload(app, tmp_path):
+    """Test that new content is copied into the upload folder under its digest, once"""
+    source = tmp_path / 'source.txt'
+    source.write_bytes(b'copied content')
+    sha256 = hashlib.sha256(b'copied content').hexdigest()
+    target = os.path.join(app.config['UPLOAD_FOLDER'], sha256)
+    try:
+        assert copy_upload(str(source), sha256)
+        assert copy_upload(str(source), sha256)
+        with open(target, 'rb') as f:
+            assert f.read() == b'copied content'
+        # The owner changing their file must not change the stored upload
+        assert os.stat(target).st_ino != os.stat(source).st_ino
+    finally:
+        os.remove(target)
+
+def test_copy_upload_rejects_changed_source(app, tmp_path):
+    """Test that a file changed since it was hashed is not stored under the old digest"""
+    source = tmp_path / 'source.txt'
+    source.write_bytes(b'changed content')
+    sha256 = hashlib.sha256(b'original content').hexdigest()
+    before = set(os.listdir(app.config['UPLOAD_FOLDER']))
+    assert not copy_upload(str(source), sha256)
+    assert not copy_upload(str(tmp_path / 'missing.txt'), sha256)
+    assert set(os.listdir(app.config['UPLOAD_FOLDER'])) == before
+
+def test_requires_postgres(app):
+    """Test that the CLI refuses to run against databases without COPY"""
+    with pytest.raises(SystemExit, match='PostgreSQL'):
+        main(['manifest', 'nobody', 'catalog.csv'])
+
+@pytest.fixture
+def pg():
+    """A PostgreSQL database for the COPY and merge SQL, from TEST_DATABASE_URL"""
+    url = os.getenv('TEST_DATABASE_URL')
+    if not url:
+        pytest.skip('TEST_DATABASE_URL is not set')
+    engine = create_engine(url)
+    db.metadata.drop_all(engine)
+    db.metadata.create_all(engine)
+    with engine.begin() as conn:
+        for user_id, name in [(1, 'alice'), (2, 'bob')]:
+            conn.execute(db.insert(User).values(id=user_id, username=name, email=f'{name}@example.com'))
+        conn.execute(db.insert(File), [
+            {'filename': 'known.bin', 'filepath': None, 'file_size': 5, 'user_id': 2, 'ipfs_status': 'completed',
+             'multihash': 'QmKnown', 'sha256': hashlib.sha256(b'known').hexdigest()},
+            {'filename': 'mine.bin', 'filepath': None, 'file_size': 7, 'user_id': 1, 'ipfs_status': 'pending',
+             'multihash': 'QmMine', 'sha256': None},
+        ])
+    yield engine
+    db.metadata.drop_all(engine)
+    engine.dispose()
+
+def alice_rows(engine):
+    with engine.connect() as conn:
+        files = conn.execute(text("""
+            SELECT filename, filepath, multihash, ipfs_status FROM file WHERE user_id = 1 ORDER BY filename
+        """)).fetchall()
+        usage = conn.execute(text("""
+            SELECT status, total_bytes, file_count FROM user_usage WHERE user_id = 1 ORDER BY status
+        """)).fetchall()
+    return [tuple(row) for row in files], [tuple(row) for row in usage]
+
+def test_merge_manifest(app, pg):
+    """Test that manifest rows follow the /upload rules when merged into the file table"""
+    known = hashlib.sha256(b'known').hexdigest()
+    manifest = io.StringIO(
+        'filename,multihash,file_size,sha256,description\n'
+        'new.bin,QmNew,10,,fresh\n'
+        f'copy.bin,QmClientGuess,5,{known.upper()},\n'
+        'again.bin,QmMine,7,,\n'
+        'twice.bin,QmNew,10,,\n'
+        'nosize.bin,QmNoSize,,,\n'
+    )
+    with pg.begin() as conn:
+        conn.execute(text(CREATE_STAGING))
+        copy_csv(conn, manifest)
+        inserted, skipped = merge(conn, 1)
+
+    assert inserted == 2
+    assert skipped == {'invalid': 1, 'already registered': 1, 'duplicate': 1}
+    files, usage = alice_rows(pg)
+    assert files == [('copy.bin', None, 'QmKnown', 'completed'), ('mine.bin', None, 'QmMine', 'pending'),
+                     ('new.bin', None, 'QmNew', 'pending')]
+    # The existing 7-byte pending row was not counted here, so only the merged rows appear
+    assert usage == [('completed', 5, 1), ('pending', 10, 1)]
+
+def test_merge_directory(app, pg, tmp_path):
+    """Test that directory rows copy new content for the processor and skip files changed since hashing"""
+    root = tmp_path / 'tree'
+    root.mkdir()
+    (root / 'new.txt').write_bytes(b'brand new')
+    (root / 'known.txt').write_bytes(b'known')
+    (root / 'dup.txt').write_bytes(b'brand new')
+    (root / 'edited.txt').write_bytes(b'before edit')
+    rows = io.StringIO()
+    hash_tree(str(root), rows, processes=1)
+    (root / 'edited.txt').write_bytes(b'after edit')
+    rows.seek(0)
+
+    new_sha256 = hashlib.sha256(b'brand new').hexdigest()
+    target = os.path.join(app.config['UPLOAD_FOLDER'], new_sha256)
+    try:
+        with pg.begin() as conn:
+            conn.execute(text(CREATE_STAGING))
+            cursor = conn.connection.driver_connection.cursor()
+            cursor.copy_expert('COPY file_import (filename, sha256, file_size, source) FROM STDIN WITH (FORMAT csv)', rows)
+            inserted, skipped = merge(conn, 1)
+
+        assert inserted == 2
+        assert skipped == {'duplicate': 1, 'changed': 1}
+        files, _ = alice_rows(pg)
+        # Either copy of the repeated content may be kept
+        files = [(name if name not in ('new.txt', 'dup.txt') else 'new', *rest) for name, *rest in files]
+        assert sorted(files) == [('known.txt', None, 'QmKnown', 'completed'), ('mine.bin', None, 'QmMine', 'pending'),
+                                 ('new', new_sha256, None, 'pending')]
+        with open(target, 'rb') as f:
+            assert f.read() == b'brand new'
+    finally:
+        if os.path.exists(target):
+            os.remove(target)
@@ -0,0 +1,160 @@
+import pytest
+from app import db, User, PinRequest, PinOffer, PinAgreement
+from matching import OrderBook, Offer, Request
+from matcher import Matcher
+
+def test_request_takes_cheapest_offer():
+    """Test that a request is filled at the lowest acceptable price"""
+    book = OrderBook()
+    book.submit_offer(Offer(1, owner=10, capacity=100, price=30, duration=30))
+    book.submit_offer(Offer(2, owner=11, capacity=100, price=20, duration=30))
+    book.submit_request(Request(1, owner=20, size=50, replicas=1, price=40, duration=30))
+
+    matches = book.match()
+    assert [(m.offer_id, m.price) for m in matches] == [(2, 20)]
+
+def test_replicas_use_distinct_offers():
+    """Test that each replica lands on a different offer and capacity is consumed"""
+    book = OrderBook()
+    book.submit_offer(Offer(1, owner=10, capacity=100, price=20, duration=30))
+    book.submit_offer(Offer(2, owner=11, capacity=60, price=20, duration=30))
+    book.submit_request(Request(1, owner=20, size=50, replicas=2, price=20, duration=30))
+
+    matches = book.match()
+    assert sorted(m.offer_id for m in matches) == [1, 2]
+
+    # Offer 2 has 10 bytes left, so only offer 1 can hold another 50
+    book.submit_request(Request(2, owner=20, size=50, replicas=2, price=20, duration=30))
+    assert [m.offer_id for m in book.match()] == [1]
+
+def test_constraints_and_resting_requests():
+    """Test price, duration and owner constraints, and that unfilled requests rest"""
+    book = OrderBook()
+    book.submit_offer(Offer(1, owner=20, capacity=100, price=10, duration=365))
+    book.submit_offer(Offer(2, owner=10, capacity=100, price=10, duration=7))
+    book.submit_offer(Offer(3, owner=11, capacity=100, price=50, duration=365))
+    book.submit_request(Request(1, owner=20, size=10, replicas=1, price=40, duration=30))
+    assert book.match() == []
+
+    # New capacity lets the resting request fill on a later tick
+    book.submit_offer(Offer(4, owner=12, capacity=100, price=40, duration=30))
+    assert [(m.request_id, m.offer_id) for m in book.match()] == [(1, 4)]
+
+def test_resting_request_skips_offers_it_holds():
+    """Test that a partly filled request never gets two replicas on one offer across ticks"""
+    book = OrderBook()
+    book.submit_offer(Offer(1, owner=10, capacity=500, price=10, duration=30))
+    book.submit_request(Request(1, owner=20, size=50, replicas=2, price=20, duration=30))
+    assert [(m.request_id, m.offer_id) for m in book.match()] == [(1, 1)]
+
+    # New capacity wakes the resting request, but offer 1 already holds a replica
+    book.submit_offer(Offer(2, owner=20, capacity=500, price=10, duration=30))
+    assert book.match() == []
+    book.submit_offer(Offer(3, owner=11, capacity=500, price=15, duration=30))
+    assert [(m.request_id, m.offer_id) for m in book.match()] == [(1, 3)]
+
+def test_higher_bid_fills_first():
+    """Test that scarce capacity goes to the highest bid in a batch"""
+    book = OrderBook()
+    book.submit_offer(Offer(1, owner=10, capacity=50, price=10, duration=30))
+    book.submit_request(Request(1, owner=20, size=50, replicas=1, price=15, duration=30))
+    book.submit_request(Request(2, owner=21, size=50, replicas=1, price=25, duration=30))
+
+    assert [m.request_id for m in book.match()] == [2]
+
+def test_matcher_persists_agreements(app):
+    """Test that the matcher writes agreements and updates order state"""
+    with app.app_context():
+        buyer = User(username='buyer', email='buyer@example.com')
+        seller = User(username='seller', email='seller@example.com')
+        db.session.add_all([buyer, seller])
+        db.session.commit()
+
+        db.session.add(PinOffer(user_id=seller.id, capacity=100, capacity_remaining=100,
+                                duration_days=30, price=10))
+        db.session.add(PinRequest(user_id=buyer.id, multihash='QmPin', size=100, replicas=2,
+                                  duration_days=30, price=20))
+        db.session.commit()
+
+        matcher = Matcher()
+        assert len(matcher.tick()) == 1
+
+        agreement = PinAgreement.query.one()
+        assert agreement.price == 10
+        pin_request = PinRequest.query.one()
+        assert pin_request.replicas_filled == 1
+        assert pin_request.status == 'open'
+        pin_offer = PinOffer.query.one()
+        assert pin_offer.capacity_remaining == 0
+        assert pin_offer.status == 'filled'
+
+def test_matcher_restart_keeps_distinct_offers(app):
+    """Test that a reloaded request skips the offers its agreements already use"""
+    with app.app_context():
+        buyer = User(username='buyer', email='buyer@example.com')
+        seller = User(username='seller', email='seller@example.com')
+        db.session.add_all([buyer, seller])
+        db.session.commit()
+        buyer_id, seller_id = buyer.id, seller.id
+
+        db.session.add(PinOffer(id=1, user_id=seller_id, capacity=500, capacity_remaining=500,
+                                duration_days=30, price=10))
+        db.session.add(PinRequest(id=1, user_id=buyer_id, multihash='QmTwice', size=100, replicas=2,
+                                  duration_days=30, price=20))
+        db.session.commit()
+        assert [(m.request_id, m.offer_id) for m in Matcher().tick()] == [(1, 1)]
+
+        # A fresh matcher must not place the second replica on offer 1 again
+        matcher = Matcher()
+        assert matcher.tick() == []
+        db.session.add(PinOffer(id=2, user_id=seller_id, capacity=500, capacity_remaining=500,
+                                duration_days=30, price=15))
+        db.session.commit()
+        assert [(m.request_id, m.offer_id) for m in matcher.tick()] == [(1, 2)]
+        assert PinRequest.query.one().status == 'filled'
+
+def test_matcher_loads_late_commits(app):
+    """Test that an order committed after a higher id was loaded still reaches the book"""
+    with app.app_context():
+        buyer = User(username='buyer', email='buyer@example.com')
+        seller = User(username='seller', email='seller@example.com')
+        db.session.add_all([buyer, seller])
+        db.session.commit()
+        buyer_id, seller_id = buyer.id, seller.id
+
+        db.session.add(PinOffer(id=10, user_id=seller_id, capacity=100, capacity_remaining=100,
+                                duration_days=30, price=30))
+        db.session.commit()
+        matcher = Matcher()
+        assert matcher.tick() == []
+
+        # Its id was taken before offer 10 but its transaction committed later
+        db.session.add(PinOffer(id=3, user_id=seller_id, capacity=100, capacity_remaining=100,
+                                duration_days=30, price=10))
+        db.session.add(PinRequest(user_id=buyer_id, multihash='QmLate', size=100, replicas=1,
+                                  duration_days=30, price=20))
+        db.session.commit()
+        assert [(m.offer_id, m.price) for m in matcher.tick()] == [(3, 10)]
+
+def test_pin_order_routes(client, app):
+    """Test posting pin requests and offers through the JSON API"""
+    with app.app_context():
+        user = User(username='pinner', email='pinner@example.com')
+        user.set_password('testpass123')
+        db.session.add(user)
+        db.session.commit()
+
+    client.post('/login', data={'username': 'pinner', 'password': 'testpass123'})
+
+    response = client.post('/pins/requests', json={
+        'multihash': 'QmPin', 'size': 100, 'replicas': 3, 'durationDays': 30, 'price': 20
+    })
+    assert response.status_code == 200
+    response = client.post('/pins/offers', json={'capacity': 1000, 'durationDays': 90, 'price': 10})
+    assert response.status_code == 200
+    response = client.post('/pins/offers', json={'capacity': -1, 'durationDays': 90, 'price': 10})
+    assert response.status_code == 400
+
+    response = client.get('/pins')
+    assert response.status_code == 200
+    assert b'QmPin' in response.data
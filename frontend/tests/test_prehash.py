@@ -0,0 +1,129 @@
+import pytest
+import hashlib
+import os
+from io import BytesIO
+from app import db, User, File
+
+CONTENT = b'prehash test content'
+SHA256 = hashlib.sha256(CONTENT).hexdigest()
+
+@pytest.fixture
+def users(app):
+    with app.app_context():
+        for name in ['owner', 'other']:
+            user = User(username=name, email=f'{name}@example.com')
+            user.set_password('testpass123')
+            db.session.add(user)
+        db.session.commit()
+
+def login(client, username):
+    client.get('/logout')
+    client.post('/login', data={'username': username, 'password': 'testpass123'})
+
+def register(client, **extra):
+    return client.post('/upload', json={
+        'multihash': 'bafkreiclientcid',
+        'sha256': SHA256,
+        'filename': 'copy.txt',
+        'fileSize': len(CONTENT),
+        **extra
+    })
+
+def test_upload_file_records_sha256(client, app, users):
+    """Test that uploaded files are hashed while being saved"""
+    login(client, 'owner')
+    data = {'file': (BytesIO(CONTENT), 'prehash.txt'), 'description': 'hashed upload'}
+    client.post('/upload_file', data=data)
+
+    with app.app_context():
+        file = File.query.filter_by(filename='prehash.txt').first()
+        assert file.sha256 == SHA256
+        assert file.filepath == SHA256
+        assert file.description == 'hashed upload'
+    os.remove(os.path.join(app.config['UPLOAD_FOLDER'], SHA256))
+
+def test_same_name_uploads_kept_apart(client, app, users):
+    """Test that a same-named upload cannot replace the bytes behind another row"""
+    login(client, 'owner')
+    client.post('/upload_file', data={'file': (BytesIO(CONTENT), 'report.txt')})
+    login(client, 'other')
+    client.post('/upload_file', data={'file': (BytesIO(b'other content'), 'report.txt')})
+
+    other_sha256 = hashlib.sha256(b'other content').hexdigest()
+    with app.app_context():
+        assert sorted(f.filepath for f in File.query.filter_by(filename='report.txt')) == sorted([SHA256, other_sha256])
+    for digest in (SHA256, other_sha256):
+        with open(os.path.join(app.config['UPLOAD_FOLDER'], digest), 'rb') as f:
+            assert hashlib.sha256(f.read()).hexdigest() == digest
+        os.remove(os.path.join(app.config['UPLOAD_FOLDER'], digest))
+
+def test_exists_endpoint(client, app, users):
+    """Test the existence check used before sending file bytes"""
+    login(client, 'owner')
+    response = client.get(f'/api/files/exists?sha256={SHA256}')
+    assert response.get_json() == {'exists': False, 'multihash': None}
+
+    with app.app_context():
+        owner = User.query.filter_by(username='owner').first()
+        db.session.add(File(filename='a.txt', filepath='a.txt', file_size=len(CONTENT), user_id=owner.id,
+                            ipfs_status='completed', multihash='QmCanonical', sha256=SHA256))
+        db.session.commit()
+
+    response = client.get(f'/api/files/exists?sha256={SHA256}')
+    assert response.get_json() == {'exists': True, 'multihash': 'QmCanonical'}
+    assert client.get('/api/files/exists?sha256=abc').status_code == 400
+
+def test_register_known_content(client, app, users):
+    """Test that known content is registered with its canonical CID and status"""
+    with app.app_context():
+        owner = User.query.filter_by(username='owner').first()
+        db.session.add(File(filename='a.txt', filepath='a.txt', file_size=len(CONTENT), user_id=owner.id,
+                            ipfs_status='completed', multihash='QmCanonical', sha256=SHA256))
+        db.session.commit()
+
+    # The owner already has it
+    login(client, 'owner')
+    response = register(client)
+    assert response.status_code == 400
+    assert b'File with this hash already exists' in response.data
+
+    # Another user can add it to their catalog without uploading
+    login(client, 'other')
+    assert register(client).status_code == 200
+    with app.app_context():
+        other = User.query.filter_by(username='other').first()
+        file = File.query.filter_by(user_id=other.id).one()
+        assert file.multihash == 'QmCanonical'
+        assert file.ipfs_status == 'completed'
+        assert other.usage_totals() == (len(CONTENT), 1)
+
+def test_register_known_content_by_sha256(client, app, users):
+    """Test that the upload page can register known content without computing a CID"""
+    login(client, 'other')
+    assert register(client, multihash=None).status_code == 400
+
+    with app.app_context():
+        owner = User.query.filter_by(username='owner').first()
+        db.session.add(File(filename='a.txt', filepath='a.txt', file_size=len(CONTENT), user_id=owner.id,
+                            ipfs_status='pending', sha256=SHA256))
+        db.session.commit()
+
+    assert register(client, multihash=None).status_code == 200
+    with app.app_context():
+        other = User.query.filter_by(username='other').first()
+        file = File.query.filter_by(user_id=other.id).one()
+        assert (file.multihash, file.ipfs_status) == (None, 'pending')
+
+def test_upload_file_rejects_own_duplicate(client, app, users):
+    """Test that a user cannot upload the same content twice"""
+    login(client, 'owner')
+    client.post('/upload_file', data={'file': (BytesIO(CONTENT), 'first.txt')})
+    response = client.post('/upload_file', data={'file': (BytesIO(CONTENT), 'second.txt')},
+                           follow_redirects=True)
+    assert b'File with this hash already exists' in response.data
+
+    with app.app_context():
+        owner = User.query.filter_by(username='owner').first()
+        assert [f.filename for f in File.query.filter_by(sha256=SHA256)] == ['first.txt']
+        assert owner.usage_totals() == (len(CONTENT), 1)
+    os.remove(os.path.join(app.config['UPLOAD_FOLDER'], SHA256))
@@ -0,0 +1,109 @@
+import pytest
+from app import db, User, File, UserUsage, record_usage
+from io import BytesIO
+
+@pytest.fixture
+def logged_in(client, app):
+    """Create a user and log them in"""
+    with app.app_context():
+        user = User(username='quotauser', email='quota@example.com')
+        user.set_password('testpass123')
+        db.session.add(user)
+        db.session.commit()
+        user_id = user.id
+
+    client.post('/login', data={
+        'username': 'quotauser',
+        'password': 'testpass123'
+    })
+    yield user_id
+    app.config['USER_QUOTA_BYTES'] = 0
+    app.config['USER_QUOTA_FILES'] = 0
+
+def register(client, multihash, size):
+    return client.post('/upload', json={
+        'multihash': multihash,
+        'filename': f'{multihash}.bin',
+        'fileSize': size
+    })
+
+def test_usage_counters_updated_on_register(client, app, logged_in):
+    """Test that registering files increments the pending counters"""
+    assert register(client, 'QmA', 100).status_code == 200
+    assert register(client, 'QmB', 50).status_code == 200
+
+    with app.app_context():
+        usage = db.session.get(UserUsage, (logged_in, 'pending'))
+        assert usage.total_bytes == 150
+        assert usage.file_count == 2
+        assert db.session.get(User, logged_in).usage_totals() == (150, 2)
+
+def test_byte_quota_rejects_register(client, app, logged_in):
+    """Test that the JSON registration path enforces the byte quota"""
+    app.config['USER_QUOTA_BYTES'] = 120
+    assert register(client, 'QmA', 100).status_code == 200
+
+    response = register(client, 'QmB', 50)
+    assert response.status_code == 413
+    assert b'Storage quota exceeded' in response.data
+
+    with app.app_context():
+        assert File.query.filter_by(multihash='QmB').first() is None
+
+def test_register_rejects_negative_size(client, app, logged_in):
+    """Test that a negative size cannot push usage below zero to get around the quota"""
+    app.config['USER_QUOTA_BYTES'] = 1000
+    response = register(client, 'QmNegative', -10**12)
+    assert (response.status_code, response.data) == (400, b'fileSize must be positive')
+    assert register(client, 'QmHuge', 100 * 1024**3).status_code == 413
+
+    with app.app_context():
+        assert File.query.count() == 0
+        assert db.session.get(User, logged_in).usage_totals() == (0, 0)
+
+def test_register_rejects_non_numeric_size(client, app, logged_in):
+    """Test that a size that is not an integer is a client error, not a server error"""
+    response = register(client, 'QmText', 'large')
+    assert (response.status_code, response.data) == (400, b'fileSize is required')
+
+def test_file_quota_rejects_register(client, app, logged_in):
+    """Test that the JSON registration path enforces the file count quota"""
+    app.config['USER_QUOTA_FILES'] = 1
+    assert register(client, 'QmA', 10).status_code == 200
+
+    response = register(client, 'QmB', 10)
+    assert response.status_code == 413
+    assert b'File count quota exceeded' in response.data
+
+def test_byte_quota_rejects_upload_file(client, app, logged_in):
+    """Test that upload_file rejects over-quota bodies without saving them"""
+    app.config['USER_QUOTA_BYTES'] = 10
+    data = {'file': (BytesIO(b'x' * 1024), 'big.bin')}
+
+    response = client.post('/upload_file', data=data, follow_redirects=True)
+    assert response.status_code == 200
+    assert b'Storage quota exceeded' in response.data
+
+    with app.app_context():
+        assert File.query.filter_by(filename='big.bin').first() is None
+        assert db.session.get(UserUsage, (logged_in, 'pending')) is None
+
+def test_usage_counters_upsert(app, logged_in):
+    """Test that counter rows created elsewhere are added to rather than inserted again"""
+    with app.app_context():
+        db.session.execute(db.insert(UserUsage).values(user_id=logged_in, status='pending',
+                                                       total_bytes=10, file_count=1))
+        db.session.commit()
+        record_usage(logged_in, 'pending', 5)
+        record_usage(logged_in, 'pending', -10, -1)
+        db.session.commit()
+        assert db.session.get(User, logged_in).usage_totals() == (5, 1)
+
+def test_chunked_upload_requires_length(client, app, logged_in):
+    """Test that uploads without a Content-Length cannot bypass the byte quota"""
+    app.config['USER_QUOTA_BYTES'] = 120
+
+    response = client.post('/upload_file', input_stream=BytesIO(b'x' * 1000), headers={
+        'Content-Type': 'multipart/form-data; boundary=x', 'Transfer-Encoding': 'chunked'
+    })
+    assert response.status_code == 411
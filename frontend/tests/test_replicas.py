@@ -0,0 +1,94 @@
+import time
+import pytest
+from sqlalchemy import create_engine, insert
+from sqlalchemy.pool import StaticPool
+from app import db, User
+from replicas import ReplicaPool
+
+@pytest.fixture
+def replica(app):
+    """An in-memory stand-in replica holding a user the primary does not have"""
+    engine = create_engine('sqlite://', poolclass=StaticPool, connect_args={'check_same_thread': False})
+    db.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(insert(User).values(id=999, username='onreplica', email='replica@example.com', password_hash='x'))
+    app.extensions['replicas'] = ReplicaPool([engine])
+    yield engine
+    db.session.remove()
+    del app.extensions['replicas']
+    engine.dispose()
+
+@pytest.fixture
+def logged_in(client, app):
+    with app.app_context():
+        user = User(username='reader', email='reader@example.com')
+        user.set_password('testpass123')
+        db.session.add(user)
+        db.session.commit()
+    client.post('/login', data={'username': 'reader', 'password': 'testpass123'})
+
+def test_read_only_views_use_replica(client, replica, logged_in):
+    """Test that search reads from the replica while other views use the primary"""
+    assert b'/profile/onreplica' in client.get('/search?q=onreplica').data
+    assert client.get('/profile/onreplica').status_code == 200
+    assert client.get('/profile/reader').status_code == 404
+
+def test_reads_stick_to_primary_after_write(client, replica, logged_in):
+    """Test that a user's own write pins their reads to the primary"""
+    response = client.post('/upload', json={'multihash': 'QmSticky', 'filename': 'a.txt', 'fileSize': 10})
+    assert response.status_code == 200
+    assert b'/profile/onreplica' not in client.get('/search?q=onreplica').data
+    assert b'a.txt' in client.get('/profile').data
+
+def test_ingest_landing_sticks_to_primary(client, replica, logged_in):
+    """Test that returning from the ingest service pins reads to the primary"""
+    assert b'/profile/onreplica' in client.get('/search?q=onreplica').data
+    response = client.get('/uploaded')
+    assert response.status_code == 302 and response.location.endswith('/profile')
+    assert b'/profile/onreplica' not in client.get('/search?q=onreplica').data
+
+def test_export_reads_primary(client, replica, logged_in):
+    """Test that exports stay on the primary, where long queries are not cancelled by replay"""
+    response = client.get('/api/export/csv?user=onreplica')
+    assert response.status_code == 200
+    assert b'onreplica' not in response.data
+
+def test_unhealthy_replica_leaves_rotation():
+    """Test that the health check drops unreachable replicas and round-robins the rest"""
+    good = [create_engine('sqlite://'), create_engine('sqlite://')]
+    bad = create_engine('sqlite:////nonexistent/dir/replica.db')
+    pool = ReplicaPool(good + [bad])
+    pool.check()
+    assert [pool.pick() for _ in range(4)] == good * 2
+
+    pool = ReplicaPool([bad])
+    pool.check()
+    assert pool.pick() is None
+
+def test_lagging_or_disconnected_replica_leaves_rotation():
+    """Test that replicas behind max_lag or not following the primary are skipped"""
+    engines = [create_engine('sqlite://') for _ in range(3)]
+    lags = dict(zip(engines, [1.0, 30.0, None]))
+
+    class Pool(ReplicaPool):
+        def _lag(self, engine):
+            return lags[engine]
+
+    pool = Pool(engines, max_lag=5.0)
+    pool.check()
+    assert pool.healthy == engines[:1]
+
+def test_replicas_checked_before_rotation():
+    """Test that a started pool serves no replica until the first check has passed it"""
+    good = create_engine('sqlite://')
+    bad = create_engine('sqlite:////nonexistent/dir/replica.db')
+    pool = ReplicaPool([bad, good])
+    pool.start(interval=3600)
+
+    deadline = time.time() + 5
+    picked = []
+    while time.time() < deadline and good not in picked:
+        picked.append(pool.pick())
+        time.sleep(0.01)
+    assert bad not in picked
+    assert good in picked
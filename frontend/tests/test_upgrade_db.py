@@ -0,0 +1,7 @@
+import pytest
+from upgrade_db import main
+
+def test_requires_postgres(app):
+    """Test that the upgrade refuses to run on databases other than PostgreSQL"""
+    with pytest.raises(SystemExit, match='PostgreSQL'):
+        main()
@@ -0,0 +1,69 @@
+"""Bring a database created by an older release up to the current schema.
+
+db.create_all() only creates missing tables, so an existing file table
+keeps its old columns. Every step is idempotent; run it once after
+upgrading (PostgreSQL only):
+
+    python upgrade_db.py
+"""
+import sys
+from app import app, db
+
+# Names match what create_all gives these objects on a fresh database
+ALTER_FILE = [
+    "ALTER TABLE file ALTER COLUMN filepath DROP NOT NULL",
+    "ALTER TABLE file ALTER COLUMN file_size TYPE BIGINT",
+    "ALTER TABLE file ADD COLUMN IF NOT EXISTS sha256 VARCHAR(64)",
+    "ALTER TABLE file ADD COLUMN IF NOT EXISTS ipfs_progress BIGINT NOT NULL DEFAULT 0",
+    "ALTER TABLE file ADD COLUMN IF NOT EXISTS ipfs_attempts INTEGER NOT NULL DEFAULT 0",
+    "ALTER TABLE file ADD COLUMN IF NOT EXISTS ipfs_claimed_at TIMESTAMP",
+    "CREATE INDEX IF NOT EXISTS ix_file_sha256 ON file (sha256)",
+]
+
+DUPLICATES = """
+    SELECT COUNT(*) FROM (
+        SELECT 1 FROM file WHERE multihash IS NOT NULL GROUP BY user_id, multihash HAVING COUNT(*) > 1
+    ) d
+"""
+
+ADD_UNIQUE = """
+    DO $$ BEGIN
+        IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'file_user_id_multihash_key') THEN
+            ALTER TABLE file ADD CONSTRAINT file_user_id_multihash_key UNIQUE (user_id, multihash);
+        END IF;
+    END $$
+"""
+
+# Counters for files uploaded before user_usage existed
+REBUILD_USAGE = """
+    INSERT INTO user_usage (user_id, status, total_bytes, file_count)
+    SELECT user_id, COALESCE(ipfs_status, 'pending'), COALESCE(SUM(file_size), 0), COUNT(*)
+    FROM file
+    GROUP BY user_id, COALESCE(ipfs_status, 'pending')
+"""
+
+def upgrade():
+    db.create_all()  # New tables: user_usage, file_tombstone and the pinning market
+    with db.engine.begin() as conn:
+        for statement in ALTER_FILE:
+            conn.execute(db.text(statement))
+
+        duplicates = conn.execute(db.text(DUPLICATES)).scalar()
+        if duplicates:
+            raise SystemExit(f"{duplicates} users registered the same CID more than once; "
+                             "remove the extra file rows and run again")
+        conn.execute(db.text(ADD_UNIQUE))
+
+        conn.execute(db.text("LOCK TABLE user_usage IN EXCLUSIVE MODE"))
+        conn.execute(db.text("DELETE FROM user_usage"))
+        conn.execute(db.text(REBUILD_USAGE))
+
+def main():
+    with app.app_context():
+        if db.engine.dialect.name != 'postgresql':
+            sys.exit('Schema upgrades require PostgreSQL; recreate other databases with init_db.py')
+        upgrade()
+    print("Database schema upgraded successfully")
+
+if __name__ == '__main__':
+    main()
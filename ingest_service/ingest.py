@@ -0,0 +1,225 @@
+"""Asynchronous upload ingestion.
+
+Accepts the same multipart form as the Flask upload_file view, but streams
+request bodies with non-blocking I/O so a slow client holds a coroutine
+instead of a WSGI worker. Users are authenticated from the Flask session
+cookie, and files land in the same upload directory and file table.
+"""
+import os
+import time
+import asyncio
+import hashlib
+import logging
+import multiprocessing
+from aiohttp import web
+from itsdangerous import URLSafeTimedSerializer, BadSignature
+from sqlalchemy import create_engine, text
+from werkzeug.utils import secure_filename
+from dotenv import load_dotenv
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+DB_URL = os.getenv('DATABASE_URL', 'postgresql://postgres:postgres@db:5432/pintrader')
+SECRET_KEY = os.environ['SECRET_KEY']  # Must match the Flask app to read its session cookie
+UPLOAD_FOLDER = os.getenv('UPLOAD_FOLDER', '/app/uploads')
+# Flask endpoint that pins the user's reads to the primary, then shows their profile
+UPLOADED_URL = os.getenv('UPLOADED_URL', '/uploaded')
+INGEST_PORT = int(os.getenv('INGEST_PORT', 5002))
+INGEST_PROCESSES = int(os.getenv('INGEST_PROCESSES', os.cpu_count() or 1))
+
+# Backpressure: uploads in flight per process, and how long a client may stall
+MAX_ACTIVE_UPLOADS = int(os.getenv('MAX_ACTIVE_UPLOADS', 2000))
+IDLE_TIMEOUT_SECONDS = float(os.getenv('IDLE_TIMEOUT_SECONDS', 60))
+CHUNK_BYTES = 256 * 1024
+
+# Same quota settings as the Flask app (0 means unlimited)
+USER_QUOTA_BYTES = int(os.getenv('USER_QUOTA_BYTES', 0))
+USER_QUOTA_FILES = int(os.getenv('USER_QUOTA_FILES', 0))
+SESSION_MAX_AGE = 31 * 24 * 3600  # Flask's default PERMANENT_SESSION_LIFETIME
+
+# Mirrors flask.sessions.SecureCookieSessionInterface
+session_serializer = URLSafeTimedSerializer(
+    SECRET_KEY,
+    salt='cookie-session',
+    signer_kwargs={'key_derivation': 'hmac', 'digest_method': hashlib.sha1}
+)
+
+class UploadRejected(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+def current_user_id(request):
+    """Return the Flask-Login user id from the session cookie, or None"""
+    cookie = request.cookies.get('session')
+    if not cookie:
+        return None
+    try:
+        session = session_serializer.loads(cookie, max_age=SESSION_MAX_AGE)
+    except BadSignature:
+        return None
+    user_id = session.get('_user_id')
+    return int(user_id) if user_id else None
+
+def check_quota(engine, user_id, incoming_bytes):
+    """Return (error message or None, bytes the user may still store or None when unlimited)"""
+    if not USER_QUOTA_BYTES and not USER_QUOTA_FILES:
+        return None, None
+    with engine.connect() as conn:
+        total_bytes, file_count = conn.execute(text("""
+            SELECT COALESCE(SUM(total_bytes), 0), COALESCE(SUM(file_count), 0)
+            FROM user_usage
+            WHERE user_id = :user_id
+        """), {"user_id": user_id}).one()
+    remaining = USER_QUOTA_BYTES - total_bytes if USER_QUOTA_BYTES else None
+    if USER_QUOTA_BYTES and total_bytes + incoming_bytes > USER_QUOTA_BYTES:
+        return 'Storage quota exceeded', remaining
+    if USER_QUOTA_FILES and file_count + 1 > USER_QUOTA_FILES:
+        return 'File count quota exceeded', remaining
+    return None, remaining
+
+def record_file(engine, user_id, filename, sha256, description, file_size):
+    """Insert the file row and bump the usage counters in one transaction"""
+    with engine.begin() as conn:
+        # As in /upload; a second row would collide on the CID the processor assigns
+        duplicate = conn.execute(text("""
+            SELECT 1 FROM file WHERE user_id = :user_id AND sha256 = :sha256 LIMIT 1
+        """), {"user_id": user_id, "sha256": sha256}).first()
+        if duplicate:
+            raise UploadRejected('File with this hash already exists')
+        conn.execute(text("""
+            INSERT INTO file (filename, filepath, sha256, description, file_size, user_id, ipfs_status, upload_date)
+            VALUES (:filename, :sha256, :sha256, :description, :file_size, :user_id, 'pending', now())
+        """), {"filename": filename, "sha256": sha256, "description": description,
+               "file_size": file_size, "user_id": user_id})
+        conn.execute(text("""
+            INSERT INTO user_usage (user_id, status, total_bytes, file_count)
+            VALUES (:user_id, 'pending', :size, 1)
+            ON CONFLICT (user_id, status) DO UPDATE
+            SET total_bytes = user_usage.total_bytes + EXCLUDED.total_bytes,
+                file_count = user_usage.file_count + 1
+        """), {"user_id": user_id, "size": file_size})
+        # Let the web workers add the content to their duplicate filters
+        conn.execute(text("SELECT pg_notify('cid_filter', :sha256)"), {"sha256": sha256})
+
+async def save_part(part, limit):
+    """Stream a multipart file part to disk under its sha256 digest, returning (filename, sha256, size)
+
+    Same-named uploads never overwrite each other, so a row's sha256 always
+    matches the bytes the processor adds.
+    """
+    loop = asyncio.get_running_loop()
+    filename = secure_filename(part.filename)
+    if not filename:
+        raise UploadRejected('No file selected')
+    partial_path = os.path.join(UPLOAD_FOLDER, f'.{os.getpid()}.{id(part)}.part')
+
+    sha256 = hashlib.sha256()
+    size = 0
+    out = await loop.run_in_executor(None, open, partial_path, 'wb')
+    try:
+        while True:
+            # Reading only when ready to write lets TCP flow control slow the client down
+            chunk = await asyncio.wait_for(part.read_chunk(CHUNK_BYTES), IDLE_TIMEOUT_SECONDS)
+            if not chunk:
+                break
+            size += len(chunk)
+            if limit is not None and size > limit:
+                raise UploadRejected('Storage quota exceeded', 413)
+            sha256.update(chunk)
+            await loop.run_in_executor(None, out.write, chunk)
+        await loop.run_in_executor(None, out.close)
+        await loop.run_in_executor(None, os.replace, partial_path, os.path.join(UPLOAD_FOLDER, sha256.hexdigest()))
+    except BaseException:
+        out.close()
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+        raise
+    return filename, sha256.hexdigest(), size
+
+async def upload_file(request):
+    user_id = current_user_id(request)
+    if user_id is None:
+        return web.Response(status=401, text='Please log in to access this page')
+
+    state = request.app['state']
+    if state['active'] >= MAX_ACTIVE_UPLOADS:
+        return web.Response(status=503, text='Too many uploads in progress', headers={'Retry-After': '5'})
+
+    state['active'] += 1
+    start = time.monotonic()
+    loop = asyncio.get_running_loop()
+    engine = request.app['engine']
+    try:
+        quota_error, remaining = await loop.run_in_executor(None, check_quota, engine, user_id,
+                                                             request.content_length or 0)
+        if quota_error:
+            raise UploadRejected(quota_error, 413)
+        # Bodies without a Content-Length are capped while streaming at what the quota has left
+        limit = remaining if request.content_length is None else None
+
+        reader = await request.multipart()
+        saved = None
+        description = ''
+        async for part in reader:
+            if part.name == 'file' and part.filename:
+                saved = await save_part(part, limit)
+            elif part.name == 'description':
+                description = await part.text()
+        if saved is None:
+            raise UploadRejected('No file selected')
+
+        filename, sha256, size = saved
+        await loop.run_in_executor(None, record_file, engine, user_id, filename, sha256, description, size)
+        logger.info(f"Ingested {filename} ({size} bytes) for user {user_id} in {time.monotonic() - start:.1f}s")
+    except UploadRejected as e:
+        return web.Response(status=e.status, text=str(e))
+    except asyncio.TimeoutError:
+        return web.Response(status=408, text='Upload stalled')
+    finally:
+        state['active'] -= 1
+
+    if 'application/json' in request.headers.get('Accept', ''):
+        return web.json_response({'message': 'File uploaded successfully', 'sha256': sha256})
+    raise web.HTTPSeeOther(UPLOADED_URL)
+
+async def health(request):
+    return web.json_response({'active': request.app['state']['active']})
+
+async def on_startup(app):
+    # Created per process, after any fork
+    app['engine'] = create_engine(DB_URL, pool_size=10)
+
+async def on_cleanup(app):
+    app['engine'].dispose()
+
+def make_app():
+    app = web.Application()
+    app['state'] = {'active': 0}
+    app.router.add_post('/upload_file', upload_file)
+    app.router.add_get('/health', health)
+    app.on_startup.append(on_startup)
+    app.on_cleanup.append(on_cleanup)
+    return app
+
+def serve():
+    web.run_app(make_app(), port=INGEST_PORT, reuse_port=True, print=None)
+
+def main():
+    """Run INGEST_PROCESSES event loops sharing the port"""
+    logger.info(f"Starting upload ingestion on port {INGEST_PORT} with {INGEST_PROCESSES} processes")
+    os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+    for _ in range(INGEST_PROCESSES - 1):
+        multiprocessing.Process(target=serve, daemon=True).start()
+    serve()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,32 @@
+import os
+import sys
+import pytest
+from sqlalchemy import create_engine, text
+
+# Must match before ingest reads its settings at import time
+os.environ.setdefault('SECRET_KEY', 'test-secret')
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import ingest
+
+@pytest.fixture
+def engine(tmp_path, monkeypatch):
+    """A SQLite stand-in for the shared database holding only the usage counters"""
+    db_url = f'sqlite:///{tmp_path}/ingest.db'
+    engine = create_engine(db_url)
+    with engine.begin() as conn:
+        conn.execute(text("""
+            CREATE TABLE user_usage (user_id INTEGER, status TEXT, total_bytes INTEGER, file_count INTEGER,
+                                     PRIMARY KEY (user_id, status))
+        """))
+    monkeypatch.setattr(ingest, 'DB_URL', db_url)
+    monkeypatch.setattr(ingest, 'UPLOAD_FOLDER', str(tmp_path))
+    yield engine
+    engine.dispose()
+
+@pytest.fixture
+def recorded(monkeypatch):
+    """Capture file rows instead of running the Postgres-only insert"""
+    rows = []
+    monkeypatch.setattr(ingest, 'record_file', lambda engine, *row: rows.append(row))
+    return rows
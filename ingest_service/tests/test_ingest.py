@@ -0,0 +1,79 @@
+import os
+import asyncio
+import hashlib
+from aiohttp.test_utils import TestClient, TestServer
+from itsdangerous import URLSafeTimedSerializer
+from sqlalchemy import text
+import ingest
+
+CONTENT = b'ingested content'
+BOUNDARY = 'ingest-test-boundary'
+
+def multipart(content):
+    return (f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="file"; filename="report.txt"\r\n'
+            f'Content-Type: application/octet-stream\r\n\r\n').encode() + content + (
+            f'\r\n--{BOUNDARY}\r\nContent-Disposition: form-data; name="description"\r\n\r\n'
+            f'ingest test\r\n--{BOUNDARY}--\r\n').encode()
+
+def cookie(user_id, secret_key=None):
+    """A Flask session cookie for user_id, signed like the web app signs it"""
+    serializer = ingest.session_serializer
+    if secret_key:
+        serializer = URLSafeTimedSerializer(secret_key, salt='cookie-session',
+                                            signer_kwargs={'key_derivation': 'hmac', 'digest_method': hashlib.sha1})
+    return serializer.dumps({'_user_id': str(user_id)})
+
+def upload(session_cookie, content=CONTENT, chunked=False, before=None, accept='application/json'):
+    """POST content to a fresh ingest app and return (status, body, headers)"""
+    async def run():
+        app = ingest.make_app()
+        async with TestClient(TestServer(app)) as client:
+            if before:
+                before(app)
+            headers = {'Accept': accept, 'Content-Type': f'multipart/form-data; boundary={BOUNDARY}'}
+            response = await client.post('/upload_file', data=multipart(content), headers=headers, chunked=chunked or None,
+                                         cookies={'session': session_cookie}, allow_redirects=False)
+            return response.status, await response.text(), response.headers
+    return asyncio.run(run())
+
+def test_accepts_flask_session(engine, recorded):
+    """Test that a cookie signed with the shared SECRET_KEY authenticates the upload"""
+    status, _, _ = upload(cookie(7))
+    assert status == 200
+    sha256 = hashlib.sha256(CONTENT).hexdigest()
+    assert recorded == [(7, 'report.txt', sha256, 'ingest test', len(CONTENT))]
+    with open(os.path.join(ingest.UPLOAD_FOLDER, sha256), 'rb') as f:
+        assert f.read() == CONTENT
+
+def test_form_upload_returns_through_flask(engine, recorded):
+    """Test that browsers are sent to the Flask landing page that marks their write"""
+    status, _, headers = upload(cookie(7), accept='text/html')
+    assert (status, headers['Location']) == (303, ingest.UPLOADED_URL)
+
+def test_rejects_foreign_cookie(engine, recorded):
+    """Test that a cookie signed with another key is not trusted"""
+    status, _, _ = upload(cookie(7, secret_key='someone-else'))
+    assert status == 401
+    assert recorded == []
+
+def test_too_many_uploads(engine, recorded):
+    """Test that uploads beyond MAX_ACTIVE_UPLOADS are turned away"""
+    def saturate(app):
+        app['state']['active'] = ingest.MAX_ACTIVE_UPLOADS
+    status, _, _ = upload(cookie(7), before=saturate)
+    assert status == 503
+    assert recorded == []
+
+def test_chunked_upload_capped_at_remaining_quota(engine, recorded, monkeypatch):
+    """Test that bodies without a Content-Length only get what is left of the quota"""
+    monkeypatch.setattr(ingest, 'USER_QUOTA_BYTES', 100)
+    with engine.begin() as conn:
+        conn.execute(text("INSERT INTO user_usage VALUES (7, 'completed', 90, 1)"))
+
+    status, body, _ = upload(cookie(7), content=b'x' * 20, chunked=True)
+    assert (status, body) == (413, 'Storage quota exceeded')
+    assert recorded == []
+
+    status, _, _ = upload(cookie(7), content=b'x' * 10, chunked=True)
+    assert status == 200
+    assert len(recorded) == 1
@@ -1,11 +1,16 @@
 import os
+import io
+import re
 import time
+import signal
 import schedule
 import logging
-from datetime import datetime
+from datetime import datetime, timedelta
 from sqlalchemy import create_engine, text
 import ipfshttpclient
 from dotenv import load_dotenv
+from tracing import Tracer, SamplingProfiler
+from unixfs import DagBuilder, DAG_PB, raw_leaf, cid_bytes, cid_str
 
 # Configure logging
 logging.basicConfig(
@@ -21,6 +26,45 @@ load_dotenv()
 DB_URL = os.getenv('DATABASE_URL', 'postgresql://postgres:postgres@db:5432/pintrader')
 engine = create_engine(DB_URL)
 
+# How often the usage counters are rebuilt from the file table
+USAGE_RECONCILE_MINUTES = int(os.getenv('USAGE_RECONCILE_MINUTES', 60))
+
+# Per-file phase traces; send SIGUSR1 to start or stop the sampling profiler
+TRACE_FILE = os.getenv('TRACE_FILE', '/app/traces/processor.jsonl')
+TRACE_SUMMARY_MINUTES = int(os.getenv('TRACE_SUMMARY_MINUTES', 5))
+PROFILE_DIR = os.getenv('PROFILE_DIR', '/app/traces')
+PROFILE_INTERVAL_MS = float(os.getenv('PROFILE_INTERVAL_MS', 10))
+
+# Large-file add mode: files of at least LARGE_FILE_BYTES are added with these
+# options and checkpoint their progress; failed files are retried MAX_ATTEMPTS times
+LARGE_FILE_BYTES = int(os.getenv('LARGE_FILE_BYTES', 64 * 1024 * 1024))
+IPFS_CHUNKER = os.getenv('IPFS_CHUNKER', 'size-262144')  # size-<bytes> or rabin-<min>-<avg>-<max>
+IPFS_RAW_LEAVES = os.getenv('IPFS_RAW_LEAVES', '1') == '1'
+IPFS_CID_VERSION = int(os.getenv('IPFS_CID_VERSION', 1))
+PROGRESS_EVERY_BYTES = int(os.getenv('PROGRESS_EVERY_BYTES', 16 * 1024 * 1024))
+LARGE_ADD_TIMEOUT = int(os.getenv('LARGE_ADD_TIMEOUT', 6 * 3600))
+MAX_ATTEMPTS = int(os.getenv('MAX_ATTEMPTS', 3))
+# Claims not renewed for this long belong to a processor that died mid-add;
+# checkpoints renew the claim, so long transfers keep theirs
+STALE_CLAIM_MINUTES = int(os.getenv('STALE_CLAIM_MINUTES', 60))
+
+# Deletes: tombstones are released in batches, and the repo is garbage
+# collected daily at REPO_GC_AT (container time), since GC stalls adds
+TOMBSTONE_BATCH = int(os.getenv('TOMBSTONE_BATCH', 1000))
+UNPIN_BATCH = int(os.getenv('UNPIN_BATCH', 100))  # CIDs per pin rm call
+REPO_GC_AT = os.getenv('REPO_GC_AT', '03:30')
+REPO_GC_TIMEOUT = int(os.getenv('REPO_GC_TIMEOUT', 4 * 3600))
+UPLOAD_DIR = '/app/uploads'
+# Uploads place content under its digest before committing the row that
+# references it, so recently placed files are left to the upload in flight
+UPLOAD_GRACE_MINUTES = int(os.getenv('UPLOAD_GRACE_MINUTES', 360))
+
+# Unknown after a restart, so the first GC window always runs
+unpinned_since_gc = None
+
+tracer = Tracer(TRACE_FILE)
+profiler = SamplingProfiler(PROFILE_DIR, interval=PROFILE_INTERVAL_MS / 1000)
+
 def get_ipfs_client():
     """Connect to IPFS daemon"""
     try:
@@ -29,6 +73,315 @@ def get_ipfs_client():
         logger.error(f"Failed to connect to IPFS daemon: {e}")
         return None
 
+def record_progress(file_id, done):
+    """Checkpoint how many bytes of a file the daemon holds, outside the caller's transaction"""
+    with engine.begin() as conn:
+        conn.execute(text("""
+            UPDATE file 
+            SET ipfs_progress = :done,
+                ipfs_claimed_at = :now
+            WHERE id = :file_id
+        """), {"file_id": file_id, "done": done, "now": datetime.now()})
+
+class ProgressReader:
+    """File wrapper that reports the bytes read every PROGRESS_EVERY_BYTES"""
+
+    def __init__(self, f, on_progress):
+        self.f = f
+        self.name = f.name
+        self.on_progress = on_progress
+        self.done = 0
+        self.reported = 0
+
+    def read(self, size=-1):
+        data = self.f.read(size)
+        self.done += len(data)
+        if self.done - self.reported >= PROGRESS_EVERY_BYTES:
+            self.on_progress(self.done)
+            self.reported = self.done
+        return data
+
+def fixed_chunk_size():
+    """Chunk size when IPFS_CHUNKER is a fixed-size chunker, otherwise None"""
+    match = re.fullmatch(r'size-(\d+)', IPFS_CHUNKER)
+    return int(match.group(1)) if match else None
+
+def put_block(client, data, codec, expected_cid):
+    key = client.block.put(io.BytesIO(data), opts={"format": codec, "mhtype": "sha2-256"})['Key']
+    if key != expected_cid:
+        raise ValueError(f"Daemon stored {codec} block as {key}, expected {expected_cid}")
+
+def has_block(client, cid):
+    try:
+        client.block.stat(cid, offline=True)
+        return True
+    except ipfshttpclient.exceptions.ErrorResponse:
+        return False
+
+def add_large_file_resumable(client, file, filepath):
+    """Send raw leaf blocks ourselves and build the UnixFS DAG, resuming after the last checkpoint
+
+    Leaves below the checkpoint are hashed locally and only re-sent if the
+    daemon has dropped them, so a retry does not repeat the transfer.
+    """
+    chunk_size = fixed_chunk_size()
+    resume_from = file.ipfs_progress or 0
+    builder = DagBuilder(lambda block: put_block(client, block, 'dag-pb', cid_str(cid_bytes(DAG_PB, block))))
+    done = checkpoint = 0
+    with open(filepath, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk and done:
+                break
+            leaf = raw_leaf(chunk)
+            if done + len(chunk) > resume_from or not has_block(client, cid_str(leaf.cid)):
+                put_block(client, chunk, 'raw', cid_str(leaf.cid))
+            builder.add_leaf(leaf)
+            done += len(chunk)
+            if done - checkpoint >= PROGRESS_EVERY_BYTES and done > resume_from:
+                record_progress(file.id, done)
+                checkpoint = done
+            if not chunk:
+                break  # An empty file is a single empty leaf
+
+    root = cid_str(builder.finish().cid)
+    client.pin.add(root)
+    return root
+
+def add_large_file(client, file, filepath):
+    """Add a large file with the configured chunker, raw-leaves and CID version"""
+    if fixed_chunk_size() and IPFS_RAW_LEAVES and IPFS_CID_VERSION == 1:
+        return add_large_file_resumable(client, file, filepath)
+
+    # Other layouts are built by the daemon; stream the file and report how much was sent
+    with open(filepath, 'rb') as f:
+        reader = ProgressReader(f, lambda done: record_progress(file.id, done))
+        result = client.add(reader, chunker=IPFS_CHUNKER, raw_leaves=IPFS_RAW_LEAVES,
+                            cid_version=IPFS_CID_VERSION, timeout=LARGE_ADD_TIMEOUT)
+    return result['Hash']
+
+def release_usage(conn, file, status):
+    """Take a file's bytes off a per-status usage counter; the caller commits"""
+    conn.execute(text("""
+        UPDATE user_usage
+        SET total_bytes = total_bytes - :size,
+            file_count = file_count - 1
+        WHERE user_id = :user_id AND status = :status
+    """), {"user_id": file.user_id, "size": file.file_size, "status": status})
+
+def move_usage(conn, file, from_status, to_status):
+    """Move a file's bytes between per-status usage counters; the caller commits"""
+    release_usage(conn, file, from_status)
+    conn.execute(text("""
+        INSERT INTO user_usage (user_id, status, total_bytes, file_count)
+        VALUES (:user_id, :to_status, :size, 1)
+        ON CONFLICT (user_id, status) DO UPDATE
+        SET total_bytes = user_usage.total_bytes + EXCLUDED.total_bytes,
+            file_count = user_usage.file_count + 1
+    """), {"user_id": file.user_id, "size": file.file_size, "to_status": to_status})
+
+def complete_registrations(conn, file, ipfs_hash):
+    """Give hash-only registrations of the same content the new CID; the caller commits"""
+    if not file.sha256:
+        return
+    waiting = conn.execute(text("""
+        SELECT id, user_id, file_size
+        FROM file
+        WHERE sha256 = :sha256 AND filepath IS NULL AND ipfs_status = 'pending'
+    """), {"sha256": file.sha256}).fetchall()
+    if not waiting:
+        return
+    conn.execute(text("""
+        UPDATE file
+        SET ipfs_status = 'completed',
+            multihash = :ipfs_hash
+        WHERE id = ANY(:ids)
+    """), {"ipfs_hash": ipfs_hash, "ids": [row.id for row in waiting]})
+    for row in waiting:
+        move_usage(conn, row, 'pending', 'completed')
+
+def unpin(client, cids):
+    """Remove recursive pins in batches, skipping CIDs this node never pinned; returns the count removed"""
+    removed = 0
+    for start in range(0, len(cids), UNPIN_BATCH):
+        batch = cids[start:start + UNPIN_BATCH]
+        try:
+            client.pin.rm(*batch)
+            removed += len(batch)
+            continue
+        except ipfshttpclient.exceptions.ErrorResponse:
+            pass
+        # One CID in the batch was not pinned; retry them one at a time
+        for cid in batch:
+            try:
+                client.pin.rm(cid)
+                removed += 1
+            except ipfshttpclient.exceptions.ErrorResponse as e:
+                if 'not pinned' not in str(e):
+                    raise
+    return removed
+
+def remove_upload(conn, filepath):
+    """Delete an upload no file row references; returns whether it was removed"""
+    path = os.path.join(UPLOAD_DIR, os.path.basename(filepath))
+    try:
+        placed = os.stat(path)
+    except FileNotFoundError:
+        return False
+    if time.time() - placed.st_ctime < UPLOAD_GRACE_MINUTES * 60:
+        return False
+
+    # Move the file aside before the last reference check, so an upload that
+    # replaces it meanwhile is put back rather than deleted
+    aside = os.path.join(UPLOAD_DIR, f".{os.path.basename(path)}.deleting")
+    try:
+        os.rename(path, aside)
+    except FileNotFoundError:
+        return False
+    referenced = conn.execute(text("""
+        SELECT 1 FROM file WHERE filepath = :filepath LIMIT 1
+    """), {"filepath": filepath}).first()
+    conn.commit()
+    if referenced or os.stat(aside).st_ino != placed.st_ino:
+        # Named by digest, so any copy already back in place holds the same bytes
+        os.replace(aside, path)
+        return False
+    os.remove(aside)
+    return True
+
+def process_tombstones():
+    """Unpin the content of deleted files once no remaining file row references it"""
+    global unpinned_since_gc
+
+    try:
+        with engine.connect() as conn:
+            client = None
+            while True:
+                tombstones = conn.execute(text("""
+                    DELETE FROM file_tombstone
+                    WHERE id IN (
+                        SELECT id FROM file_tombstone
+                        ORDER BY id
+                        LIMIT :batch
+                        FOR UPDATE SKIP LOCKED
+                    )
+                    RETURNING multihash, filepath
+                """), {"batch": TOMBSTONE_BATCH}).fetchall()
+                if not tombstones:
+                    conn.commit()
+                    break
+
+                # Reference counting: content shared with other rows stays pinned
+                cids = {row.multihash for row in tombstones if row.multihash}
+                if cids:
+                    cids -= {row.multihash for row in conn.execute(text("""
+                        SELECT DISTINCT multihash FROM file WHERE multihash = ANY(:cids)
+                    """), {"cids": list(cids)})}
+                paths = {row.filepath for row in tombstones if row.filepath}
+                if paths:
+                    paths -= {row.filepath for row in conn.execute(text("""
+                        SELECT DISTINCT filepath FROM file WHERE filepath = ANY(:paths)
+                    """), {"paths": list(paths)})}
+
+                removed = 0
+                if cids:
+                    client = client or get_ipfs_client()
+                    if not client:
+                        logger.error("Could not connect to IPFS daemon")
+                        conn.rollback()
+                        break
+                    with tracer.span('unpin', None, cids=len(cids)) as span:
+                        removed = span['removed'] = unpin(client, sorted(cids))
+                # Tombstones are only consumed once their pins are gone
+                conn.commit()
+                unpinned_since_gc = (unpinned_since_gc or 0) + removed
+
+                # Rows that committed after the reference check get their pins back
+                repinned = 0
+                if removed:
+                    referenced = [row.multihash for row in conn.execute(text("""
+                        SELECT DISTINCT multihash FROM file WHERE multihash = ANY(:cids)
+                    """), {"cids": sorted(cids)})]
+                    conn.commit()
+                    for cid in referenced:
+                        try:
+                            client.pin.add(cid)
+                            repinned += 1
+                        except ipfshttpclient.exceptions.ErrorResponse as e:
+                            logger.error(f"Could not pin {cid} again: {e}")
+
+                uploads = sum(remove_upload(conn, path) for path in sorted(paths))
+                logger.info(f"Released {len(tombstones)} deleted files: unpinned {removed} CIDs "
+                            f"({repinned} pinned again), removed {uploads} uploads")
+            if client:
+                client.close()
+    except Exception as e:
+        logger.error(f"Error in process_tombstones: {e}")
+
+def run_repo_gc():
+    """Reclaim the blocks of unpinned content"""
+    global unpinned_since_gc
+    if unpinned_since_gc == 0:
+        logger.info("Skipping repo GC: nothing unpinned since the last run")
+        return
+
+    client = get_ipfs_client()
+    if not client:
+        logger.error("Could not connect to IPFS daemon")
+        return
+    try:
+        before = client.repo.stat()['RepoSize']
+        with tracer.span('gc', None) as span:
+            # Not quiet: a quiet gc returns before the daemon finishes and closes the request
+            removed = client.repo.gc(timeout=REPO_GC_TIMEOUT)
+            span['blocks'] = sum(1 for item in removed if 'Key' in item)
+        after = client.repo.stat()['RepoSize']
+        unpinned_since_gc = 0
+        logger.info(f"Repo GC removed {span['blocks']} blocks, repo size {before} -> {after} bytes")
+    except Exception as e:
+        logger.error(f"Error in run_repo_gc: {e}")
+    finally:
+        client.close()
+
+def reconcile_usage():
+    """Rebuild the usage counters from the file table to repair any drift"""
+    logger.info("Reconciling user usage counters...")
+    
+    try:
+        with engine.begin() as conn:
+            # Block counter writers so no in-flight upload is counted twice or lost
+            conn.execute(text("LOCK TABLE user_usage IN EXCLUSIVE MODE"))
+            conn.execute(text("DELETE FROM user_usage"))
+            result = conn.execute(text("""
+                INSERT INTO user_usage (user_id, status, total_bytes, file_count)
+                SELECT user_id, COALESCE(ipfs_status, 'pending'), COALESCE(SUM(file_size), 0), COUNT(*)
+                FROM file
+                GROUP BY user_id, COALESCE(ipfs_status, 'pending')
+            """))
+            logger.info(f"Rebuilt {result.rowcount} usage counter rows")
+    except Exception as e:
+        logger.error(f"Error in reconcile_usage: {e}")
+
+def release_stale_claims(conn):
+    """Fail files left in processing by a processor that stopped, so they are retried from their checkpoint"""
+    stale_before = datetime.now() - timedelta(minutes=STALE_CLAIM_MINUTES)
+    stale = conn.execute(text("""
+        SELECT id, user_id, file_size
+        FROM file
+        WHERE ipfs_status = 'processing' AND (ipfs_claimed_at IS NULL OR ipfs_claimed_at < :stale_before)
+    """), {"stale_before": stale_before}).fetchall()
+    for file in stale:
+        released = conn.execute(text("""
+            UPDATE file
+            SET ipfs_status = 'failed'
+            WHERE id = :file_id AND ipfs_status = 'processing'
+              AND (ipfs_claimed_at IS NULL OR ipfs_claimed_at < :stale_before)
+        """), {"file_id": file.id, "stale_before": stale_before}).rowcount
+        if released:
+            move_usage(conn, file, 'processing', 'failed')
+            logger.warning(f"Released stale claim on file {file.id}")
+    conn.commit()
+
 def process_pending_files():
     """Process files that are pending IPFS upload"""
     logger.info("Checking for pending files...")
@@ -36,16 +389,21 @@ def process_pending_files():
     try:
         # Get connection from pool
         with engine.connect() as conn:
-            # Find pending files
+            release_stale_claims(conn)
+
+            # Find pending files, plus failed ones that still have retries left
             query = text("""
-                SELECT id, filename, filepath, user_id 
+                SELECT id, filename, filepath, user_id, file_size, sha256, ipfs_status, ipfs_progress 
                 FROM file 
-                WHERE ipfs_status = 'pending'
+                WHERE filepath IS NOT NULL
+                  AND (ipfs_status = 'pending' OR (ipfs_status = 'failed' AND ipfs_attempts < :max_attempts))
                 ORDER BY upload_date ASC
                 LIMIT 10
             """)
             
-            pending_files = conn.execute(query).fetchall()
+            with tracer.span('select', None) as select_span:
+                pending_files = conn.execute(query, {"max_attempts": MAX_ATTEMPTS}).fetchall()
+                select_span['files'] = len(pending_files)
             
             if not pending_files:
                 logger.info("No pending files found")
@@ -60,50 +418,100 @@ def process_pending_files():
                 return
                 
             for file in pending_files:
+                status = file.ipfs_status
                 try:
                     # Update status to processing
-                    update_query = text("""
-                        UPDATE file 
-                        SET ipfs_status = 'processing' 
-                        WHERE id = :file_id
-                    """)
-                    conn.execute(update_query, {"file_id": file.id})
-                    conn.commit()
+                    with tracer.span('claim', file.id):
+                        update_query = text("""
+                            UPDATE file 
+                            SET ipfs_status = 'processing',
+                                ipfs_attempts = ipfs_attempts + 1,
+                                ipfs_claimed_at = :now
+                            WHERE id = :file_id AND ipfs_status = :status
+                        """)
+                        claimed = conn.execute(update_query, {"file_id": file.id, "status": status,
+                                                              "now": datetime.now()}).rowcount
+                        if claimed:
+                            move_usage(conn, file, status, 'processing')
+                        conn.commit()
+                    if not claimed:
+                        continue  # Deleted or claimed elsewhere since it was listed
+                    status = 'processing'
                     
                     # Add file to IPFS
                     # Use just the filename, since the volume mount already points to the uploads directory
-                    filepath = os.path.join('/app/uploads', os.path.basename(file.filepath))
-                    if not os.path.exists(filepath):
-                        logger.error(f"File not found: {filepath}")
-                        continue
+                    filepath = os.path.join(UPLOAD_DIR, os.path.basename(file.filepath))
+                    with tracer.span('stat', file.id) as stat_span:
+                        exists = os.path.exists(filepath)
+                        stat_span['bytes'] = os.path.getsize(filepath) if exists else 0
+                    if not exists:
+                        # Fails the claim below rather than leaving the row in processing
+                        raise FileNotFoundError(f"File not found: {filepath}")
                         
-                    result = client.add(filepath)
-                    ipfs_hash = result['Hash']
+                    # Covers the transfer and the daemon's chunking and DAG building
+                    with tracer.span('add', file.id, bytes=stat_span['bytes']) as add_span:
+                        if stat_span['bytes'] >= LARGE_FILE_BYTES:
+                            add_span['mode'] = 'large'
+                            add_span['resumed_from'] = file.ipfs_progress
+                            ipfs_hash = add_large_file(client, file, filepath)
+                        else:
+                            result = client.add(filepath)
+                            ipfs_hash = result['Hash']
+                        add_span['cid'] = ipfs_hash
                     
                     # Update database with IPFS hash
-                    update_query = text("""
-                        UPDATE file 
-                        SET ipfs_status = 'completed',
-                            multihash = :ipfs_hash
-                        WHERE id = :file_id
-                    """)
-                    conn.execute(update_query, {
-                        "file_id": file.id,
-                        "ipfs_hash": ipfs_hash
-                    })
-                    conn.commit()
+                    with tracer.span('commit', file.id):
+                        # Two uploads of the same content by one user that raced past the
+                        # duplicate check; the unique (user_id, multihash) keeps only one
+                        duplicate = conn.execute(text("""
+                            SELECT id FROM file
+                            WHERE user_id = :user_id AND multihash = :ipfs_hash AND id <> :file_id
+                        """), {"user_id": file.user_id, "ipfs_hash": ipfs_hash, "file_id": file.id}).first()
+                        if duplicate:
+                            conn.execute(text("DELETE FROM file WHERE id = :file_id"), {"file_id": file.id})
+                            release_usage(conn, file, status)
+                            conn.commit()
+                            logger.info(f"Removed file {file.id}, a duplicate of file {duplicate.id}")
+                            continue
+
+                        update_query = text("""
+                            UPDATE file 
+                            SET ipfs_status = 'completed',
+                                multihash = :ipfs_hash,
+                                ipfs_progress = file_size
+                            WHERE id = :file_id
+                        """)
+                        updated = conn.execute(update_query, {
+                            "file_id": file.id,
+                            "ipfs_hash": ipfs_hash
+                        }).rowcount
+                        if updated:
+                            move_usage(conn, file, status, 'completed')
+                        else:
+                            # Deleted while being added; release the new pin like any other delete
+                            conn.execute(text("""
+                                INSERT INTO file_tombstone (user_id, multihash, sha256, filepath, deleted_at)
+                                VALUES (:user_id, :ipfs_hash, :sha256, :filepath, now())
+                            """), {"user_id": file.user_id, "ipfs_hash": ipfs_hash,
+                                   "sha256": file.sha256, "filepath": file.filepath})
+                        complete_registrations(conn, file, ipfs_hash)
+                        # Let the web workers add the new CID to their duplicate filters
+                        conn.execute(text("SELECT pg_notify('cid_filter', :ipfs_hash)"), {"ipfs_hash": ipfs_hash})
+                        conn.commit()
                     
                     logger.info(f"Successfully processed file {file.filename} (ID: {file.id})")
                     
                 except Exception as e:
                     logger.error(f"Error processing file {file.filename} (ID: {file.id}): {e}")
+                    conn.rollback()
                     # Update status to failed
                     update_query = text("""
                         UPDATE file 
                         SET ipfs_status = 'failed' 
                         WHERE id = :file_id
                     """)
-                    conn.execute(update_query, {"file_id": file.id})
+                    if conn.execute(update_query, {"file_id": file.id}).rowcount:
+                        move_usage(conn, file, status, 'failed')
                     conn.commit()
             
             client.close()
@@ -117,6 +525,14 @@ def main():
     
     # Schedule the job to run every minute
     schedule.every(1).minutes.do(process_pending_files)
+    schedule.every(USAGE_RECONCILE_MINUTES).minutes.do(reconcile_usage)
+    schedule.every(TRACE_SUMMARY_MINUTES).minutes.do(tracer.log_summary)
+    schedule.every(1).minutes.do(process_tombstones)
+    schedule.every().day.at(REPO_GC_AT).do(run_repo_gc)
+    
+    signal.signal(signal.SIGUSR1, profiler.toggle)
+    if os.getenv('PROFILE_ON_START') == '1':
+        profiler.start()
     
     # Run immediately on startup
     process_pending_files()
@@ -0,0 +1,73 @@
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy import create_engine, text
+import processor
+from tracing import Tracer
+
+@pytest.fixture
+def engine(tmp_path, monkeypatch):
+    engine = create_engine(f"sqlite:///{tmp_path / 'files.db'}")
+    with engine.begin() as conn:
+        conn.execute(text("""
+            CREATE TABLE file (
+                id INTEGER PRIMARY KEY, filename TEXT, filepath TEXT, user_id INTEGER, file_size INTEGER,
+                sha256 TEXT, multihash TEXT, ipfs_status TEXT, ipfs_progress INTEGER DEFAULT 0,
+                ipfs_attempts INTEGER DEFAULT 0, ipfs_claimed_at TIMESTAMP, upload_date TIMESTAMP
+            )
+        """))
+        conn.execute(text("""
+            CREATE TABLE user_usage (
+                user_id INTEGER, status TEXT, total_bytes INTEGER, file_count INTEGER,
+                PRIMARY KEY (user_id, status)
+            )
+        """))
+    monkeypatch.setattr(processor, 'engine', engine)
+    monkeypatch.setattr(processor, 'UPLOAD_DIR', str(tmp_path))
+    monkeypatch.setattr(processor, 'tracer', Tracer(str(tmp_path / 'trace.jsonl')))
+    yield engine
+    engine.dispose()
+
+def add_file(engine, file_id, status, claimed_at=None):
+    with engine.begin() as conn:
+        conn.execute(text("""
+            INSERT INTO file (id, filename, filepath, user_id, file_size, ipfs_status, ipfs_claimed_at, upload_date)
+            VALUES (:id, 'big.bin', 'ab12', 7, 100, :status, :claimed_at, :now)
+        """), {"id": file_id, "status": status, "claimed_at": claimed_at, "now": datetime.now()})
+        conn.execute(text("""
+            INSERT INTO user_usage VALUES (7, :status, 100, 1)
+            ON CONFLICT (user_id, status) DO UPDATE
+            SET total_bytes = total_bytes + 100, file_count = file_count + 1
+        """), {"status": status})
+
+def state(engine):
+    with engine.connect() as conn:
+        files = conn.execute(text("SELECT id, ipfs_status, ipfs_attempts FROM file ORDER BY id")).fetchall()
+        usage = conn.execute(text("""
+            SELECT status, total_bytes, file_count FROM user_usage WHERE file_count > 0 ORDER BY status
+        """)).fetchall()
+    return [tuple(row) for row in files], [tuple(row) for row in usage]
+
+def test_stale_claims_released(engine):
+    """Test that processing rows whose claim was not renewed are failed so they can be retried"""
+    add_file(engine, 1, 'processing', datetime.now() - timedelta(minutes=processor.STALE_CLAIM_MINUTES + 1))
+    add_file(engine, 2, 'processing')  # Claimed before claims were timestamped
+    add_file(engine, 3, 'processing', datetime.now())
+    with engine.connect() as conn:
+        processor.release_stale_claims(conn)
+
+    files, usage = state(engine)
+    assert files == [(1, 'failed', 0), (2, 'failed', 0), (3, 'processing', 0)]
+    assert usage == [('failed', 200, 2), ('processing', 100, 1)]
+
+def test_missing_upload_fails_claim(engine, monkeypatch):
+    """Test that a file whose upload is gone is marked failed instead of staying in processing"""
+    class Client:
+        def close(self):
+            pass
+    monkeypatch.setattr(processor, 'get_ipfs_client', Client)
+    add_file(engine, 1, 'pending')
+    processor.process_pending_files()
+
+    files, usage = state(engine)
+    assert files == [(1, 'failed', 1)]
+    assert usage == [('failed', 100, 1)]
@@ -0,0 +1,55 @@
+import json
+import pytest
+import processor
+from tracing import Tracer
+
+class StubRepo:
+    def __init__(self):
+        self.gc_calls = []
+        self.size = 1000
+
+    def stat(self):
+        return {'RepoSize': self.size}
+
+    def gc(self, **kwargs):
+        self.gc_calls.append(kwargs)
+        self.size = 400
+        return [{'Key': 'bafyone'}, {'Key': 'bafytwo'}]
+
+class StubClient:
+    def __init__(self):
+        self.repo = StubRepo()
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    client = StubClient()
+    monkeypatch.setattr(processor, 'get_ipfs_client', lambda: client)
+    monkeypatch.setattr(processor, 'tracer', Tracer(str(tmp_path / 'trace.jsonl')))
+    return client
+
+def test_gc_runs_and_resets_counter(client, monkeypatch):
+    """Test that GC waits for the daemon's list of removed blocks and resets the unpin counter"""
+    monkeypatch.setattr(processor, 'unpinned_since_gc', 5)
+    processor.run_repo_gc()
+    assert client.repo.gc_calls == [{'timeout': processor.REPO_GC_TIMEOUT}]
+    assert processor.unpinned_since_gc == 0
+    assert client.closed
+    with open(processor.tracer.path) as f:
+        assert json.loads(f.readline())['blocks'] == 2
+
+def test_gc_skipped_when_nothing_unpinned(client, monkeypatch):
+    """Test that GC is skipped once a run has reset the counter and nothing was unpinned since"""
+    monkeypatch.setattr(processor, 'unpinned_since_gc', 0)
+    processor.run_repo_gc()
+    assert client.repo.gc_calls == []
+
+def test_gc_runs_after_restart(client, monkeypatch):
+    """Test that the first GC window after a restart always runs"""
+    monkeypatch.setattr(processor, 'unpinned_since_gc', None)
+    processor.run_repo_gc()
+    assert len(client.repo.gc_calls) == 1
+    assert processor.unpinned_since_gc == 0
@@ -0,0 +1,44 @@
+import pytest
+from sqlalchemy import create_engine, text
+import processor
+
+@pytest.fixture
+def uploads(tmp_path, monkeypatch):
+    monkeypatch.setattr(processor, 'UPLOAD_DIR', str(tmp_path))
+    monkeypatch.setattr(processor, 'UPLOAD_GRACE_MINUTES', 0)
+    return tmp_path
+
+@pytest.fixture
+def conn():
+    engine = create_engine('sqlite://')
+    with engine.connect() as conn:
+        conn.execute(text("CREATE TABLE file (id INTEGER PRIMARY KEY, filepath TEXT)"))
+        conn.commit()
+        yield conn
+    engine.dispose()
+
+def test_removes_unreferenced_upload(uploads, conn):
+    """Test that uploads no row references are deleted without leaving the aside copy"""
+    (uploads / 'ab12').write_bytes(b'gone')
+    assert processor.remove_upload(conn, 'ab12')
+    assert list(uploads.iterdir()) == []
+
+def test_keeps_upload_referenced_after_check(uploads, conn):
+    """Test that an upload registered after the tombstone batch was checked stays in place"""
+    (uploads / 'ab12').write_bytes(b'shared')
+    conn.execute(text("INSERT INTO file (filepath) VALUES ('ab12')"))
+    conn.commit()
+    assert not processor.remove_upload(conn, 'ab12')
+    assert [path.name for path in uploads.iterdir()] == ['ab12']
+    assert (uploads / 'ab12').read_bytes() == b'shared'
+
+def test_keeps_recently_placed_upload(uploads, conn, monkeypatch):
+    """Test that content placed by an upload whose row has not committed yet is kept"""
+    monkeypatch.setattr(processor, 'UPLOAD_GRACE_MINUTES', 360)
+    (uploads / 'ab12').write_bytes(b'in flight')
+    assert not processor.remove_upload(conn, 'ab12')
+    assert (uploads / 'ab12').exists()
+
+def test_missing_upload(uploads, conn):
+    """Test that uploads already gone are skipped"""
+    assert not processor.remove_upload(conn, 'ab12')
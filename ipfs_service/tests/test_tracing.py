@@ -0,0 +1,83 @@
+import os
+import json
+import time
+import logging
+import pytest
+from tracing import Tracer, SamplingProfiler
+
+def records(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f]
+
+def test_span_writes_record(tmp_path):
+    """Test that a span writes its phase, file, fields and duration"""
+    tracer = Tracer(str(tmp_path / 'traces' / 'processor.jsonl'))
+    with tracer.span('add', 7, bytes=1024) as span:
+        span['cid'] = 'bafyadded'
+
+    [record] = records(tracer.path)
+    assert {key: record[key] for key in ('phase', 'file_id', 'bytes', 'cid')} == \
+        {'phase': 'add', 'file_id': 7, 'bytes': 1024, 'cid': 'bafyadded'}
+    assert record['duration_ms'] >= 0 and 'error' not in record
+    assert tracer.window['add'] == [(record['duration_ms'], 1024)]
+
+def test_span_records_error(tmp_path):
+    """Test that a failing phase is recorded with its error and the exception still propagates"""
+    tracer = Tracer(str(tmp_path / 'processor.jsonl'))
+    with pytest.raises(FileNotFoundError):
+        with tracer.span('stat', 7):
+            raise FileNotFoundError('File not found: /app/uploads/ab12')
+
+    [record] = records(tracer.path)
+    assert (record['phase'], record['error']) == ('stat', 'File not found: /app/uploads/ab12')
+
+def test_trace_file_rotates(tmp_path):
+    """Test that the trace file moves aside once it passes max_bytes"""
+    tracer = Tracer(str(tmp_path / 'processor.jsonl'), max_bytes=200)
+    for file_id in range(10):
+        with tracer.span('claim', file_id):
+            pass
+
+    # One older generation is kept, and together they end with the latest record
+    ids = [r['file_id'] for r in records(tracer.path + '.1') + records(tracer.path)]
+    assert ids == list(range(10 - len(ids), 10))
+    assert os.path.getsize(tracer.path + '.1') > 200
+    assert not os.path.exists(tracer.path + '.2')
+
+def test_log_summary(tmp_path, caplog):
+    """Test that summaries report each phase and start a new window"""
+    tracer = Tracer(str(tmp_path / 'processor.jsonl'))
+    tracer.window['add'] = [(100.0, 10 * 1024 * 1024), (300.0, 30 * 1024 * 1024)]
+    tracer.window['claim'] = [(2.0, 0)]
+
+    with caplog.at_level(logging.INFO, logger='tracing'):
+        tracer.log_summary()
+        tracer.log_summary()
+    assert caplog.messages == [
+        'Trace summary add: n=2 mean=200.0ms p95=300.0ms max=300.0ms 100.00MB/s',
+        'Trace summary claim: n=1 mean=2.0ms p95=2.0ms max=2.0ms',
+        'Trace summary: no files processed',
+    ]
+
+def busy(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        sum(range(1000))
+
+def test_profiler_toggle(tmp_path):
+    """Test that toggling starts sampling and toggling again writes collapsed stacks"""
+    profiler = SamplingProfiler(str(tmp_path / 'profiles'), interval=0.001)
+    assert profiler.stop() is None
+
+    profiler.toggle()
+    assert profiler.running
+    busy(0.2)
+    profiler.toggle()
+    assert not profiler.running and not profiler.thread.is_alive()
+
+    [name] = os.listdir(tmp_path / 'profiles')
+    assert name.startswith('profile-') and name.endswith('.folded')
+    with open(tmp_path / 'profiles' / name) as f:
+        lines = f.read().splitlines()
+    assert lines and all(line.rsplit(' ', 1)[1].isdigit() for line in lines)
+    assert any('test_tracing.py:busy:' in line for line in lines)
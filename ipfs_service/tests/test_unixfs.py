@@ -0,0 +1,122 @@
+import hashlib
+import pytest
+from unixfs import DagBuilder, MAX_LINKS, DAG_PB, RAW, raw_leaf, cid_bytes, cid_str
+
+def read_varint(data, pos):
+    value = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7f) << shift
+        shift += 7
+        if byte < 0x80:
+            return value, pos
+
+def read_fields(data):
+    """Decode a protobuf message into [(field number, value)] in wire order"""
+    fields = []
+    pos = 0
+    while pos < len(data):
+        key, pos = read_varint(data, pos)
+        if key & 7 == 2:
+            length, pos = read_varint(data, pos)
+            fields.append((key >> 3, data[pos:pos + length]))
+            pos += length
+        else:
+            value, pos = read_varint(data, pos)
+            fields.append((key >> 3, value))
+    return fields
+
+def build(chunks):
+    """Run chunks through DagBuilder, returning (root Link, {cid: block})"""
+    blocks = {}
+    builder = DagBuilder(lambda block: blocks.setdefault(cid_bytes(DAG_PB, block), block))
+    for chunk in chunks:
+        link = raw_leaf(chunk)
+        blocks[link.cid] = chunk
+        builder.add_leaf(link)
+    return builder.finish(), blocks
+
+def check(cid, blocks):
+    """Verify a subtree against the dag-pb and UnixFS specs; returns (shape, filesize, tsize)
+
+    shape is 'leaf' for a raw block, otherwise the list of child shapes.
+    """
+    block = blocks[cid]
+    assert cid[-32:] == hashlib.sha256(block).digest()
+    if cid[1] == RAW:
+        return 'leaf', len(block), len(block)
+
+    fields = read_fields(block)
+    # Canonical dag-pb: every Link (2) precedes the single Data (1)
+    assert [number for number, _ in fields] == [2] * (len(fields) - 1) + [1]
+    unixfs = read_fields(fields[-1][1])
+    assert unixfs[0] == (1, 2)  # Type: File, with no inline data
+    filesize = dict(unixfs[:2])[3]
+    blocksizes = [value for number, value in unixfs[2:] if number == 4]
+    assert len(unixfs) == 2 + len(blocksizes)
+
+    shape = []
+    tsize = len(block)
+    for (_, link), blocksize in zip(fields[:-1], blocksizes, strict=True):
+        link_fields = read_fields(link)
+        assert [number for number, _ in link_fields] == [1, 2, 3]
+        (_, child), (_, name), (_, link_tsize) = link_fields
+        assert name == b''
+        child_shape, child_filesize, child_tsize = check(child, blocks)
+        assert (blocksize, link_tsize) == (child_filesize, child_tsize)
+        shape.append(child_shape)
+        tsize += child_tsize
+    assert 0 < len(shape) <= MAX_LINKS
+    assert filesize == sum(blocksizes)
+    return shape, filesize, tsize
+
+def chunks(count):
+    return [i.to_bytes(4, 'big') * 4 for i in range(count)]
+
+def test_single_leaf_is_raw():
+    """Test that a one-chunk file is its raw leaf, as ipfs add --raw-leaves --cid-version=1 returns"""
+    root, _ = build([b'hello world'])
+    assert cid_str(root.cid) == 'bafkreifzjut3te2nhyekklss27nh3k72ysco7y32koao5eei66wof36n5e'
+    root, _ = build([b''])
+    assert cid_str(root.cid) == 'bafkreihdwdcefgh4dqkjv67uzcmw7ojee6xedzdetojuzjevtenxquvyku'
+
+def test_full_node():
+    """Test that 174 leaves fit under one root"""
+    root, blocks = build(chunks(MAX_LINKS))
+    shape, filesize, tsize = check(root.cid, blocks)
+    assert shape == ['leaf'] * MAX_LINKS
+    assert (root.filesize, root.tsize) == (filesize, tsize) == (16 * MAX_LINKS, tsize)
+
+def test_overflow_adds_a_level():
+    """Test that leaf 175 goes under its own node beside the full one, like the balanced layout"""
+    root, blocks = build(chunks(MAX_LINKS + 1))
+    shape, filesize, _ = check(root.cid, blocks)
+    assert shape == [['leaf'] * MAX_LINKS, ['leaf']]
+    assert filesize == 16 * (MAX_LINKS + 1)
+
+def test_overflow_past_two_levels():
+    """Test that leaf 174^2+1 hangs off a chain of single-link nodes beside the full subtree"""
+    root, blocks = build(chunks(MAX_LINKS ** 2 + 1))
+    shape, filesize, _ = check(root.cid, blocks)
+    assert shape == [[['leaf'] * MAX_LINKS] * MAX_LINKS, [['leaf']]]
+    assert filesize == 16 * (MAX_LINKS ** 2 + 1)
+
+@pytest.mark.parametrize('count, expected', [
+    (MAX_LINKS, 'bafybeigifod23gkthy5akvjgglq6ymcogsdxtg35562zuavrpv2xsyurbq'),
+    (MAX_LINKS + 1, 'bafybeicxdxmjmt5nptp7fmixiwfyi5p6u56zoomgd35ckz2ofqy7tyz43q'),
+    (MAX_LINKS ** 2 + 1, 'bafybeiha3d42gktp62yesxgjnk72g5lttygnctrvjcu4rqeom533f2goai'),
+])
+def test_root_cids(count, expected):
+    """Pin multi-block root CIDs so encoding changes are caught
+
+    Produced by this encoder. The structure tests above check them against
+    the dag-pb and UnixFS specs, but a reference importer was not available
+    offline to confirm these CIDs.
+    """
+    root, _ = build(chunks(count))
+    assert cid_str(root.cid) == expected
+
+def test_finish_without_leaves():
+    with pytest.raises(ValueError):
+        DagBuilder(lambda block: None).finish()
@@ -0,0 +1,127 @@
+"""Per-file phase tracing and an on-demand sampling profiler for the IPFS processor."""
+import os
+import sys
+import json
+import time
+import logging
+import threading
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+class Tracer:
+    """Writes one JSONL record per phase of each file and keeps stats for periodic summaries"""
+
+    def __init__(self, path, max_bytes=50 * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.window = defaultdict(list)  # phase -> [(duration_ms, bytes), ...] since the last summary
+        self.lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+
+    @contextmanager
+    def span(self, phase, file_id, **fields):
+        """Time a phase; the caller may add fields such as bytes to the yielded dict"""
+        record = {'phase': phase, 'file_id': file_id, **fields}
+        start = time.perf_counter()
+        try:
+            yield record
+        except Exception as e:
+            record['error'] = str(e)
+            raise
+        finally:
+            record['duration_ms'] = round((time.perf_counter() - start) * 1000, 3)
+            record['ts'] = time.time()
+            self._write(record)
+
+    def _write(self, record):
+        line = json.dumps(record) + '\n'
+        with self.lock:
+            self.window[record['phase']].append((record['duration_ms'], record.get('bytes', 0)))
+            try:
+                if os.path.exists(self.path) and os.path.getsize(self.path) > self.max_bytes:
+                    os.replace(self.path, self.path + '.1')
+                with open(self.path, 'a') as f:
+                    f.write(line)
+            except OSError as e:
+                logger.warning(f"Could not write trace record: {e}")
+
+    def log_summary(self):
+        """Log per-phase counts, latency percentiles and throughput, then start a new window"""
+        with self.lock:
+            window, self.window = self.window, defaultdict(list)
+        if not window:
+            logger.info("Trace summary: no files processed")
+            return
+        for phase, samples in sorted(window.items()):
+            durations = sorted(d for d, _ in samples)
+            total_ms = sum(durations)
+            total_bytes = sum(b for _, b in samples)
+            p95 = durations[min(len(durations) - 1, int(len(durations) * 0.95))]
+            summary = (f"Trace summary {phase}: n={len(durations)} "
+                       f"mean={total_ms / len(durations):.1f}ms p95={p95:.1f}ms max={durations[-1]:.1f}ms")
+            if total_bytes and total_ms:
+                summary += f" {total_bytes / 1024 / 1024 / (total_ms / 1000):.2f}MB/s"
+            logger.info(summary)
+
+class SamplingProfiler:
+    """Samples a thread's stack on a timer and writes collapsed stacks for flame graphs"""
+
+    def __init__(self, output_dir, interval=0.01, thread_id=None):
+        self.output_dir = output_dir
+        self.interval = interval
+        self.thread_id = thread_id or threading.main_thread().ident
+        self.stacks = Counter()
+        self.running = False
+        self.thread = None
+
+    def _sample(self):
+        while self.running:
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}")
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+            time.sleep(self.interval)
+
+    def start(self):
+        if self.running:
+            return
+        self.stacks = Counter()
+        self.running = True
+        self.thread = threading.Thread(target=self._sample, daemon=True)
+        self.thread.start()
+        logger.info("Sampling profiler started")
+
+    def stop(self):
+        """Stop sampling and write the collapsed stacks; returns the output path"""
+        if not self.running:
+            return None
+        self.running = False
+        self.thread.join()
+
+        os.makedirs(self.output_dir, exist_ok=True)
+        path = os.path.join(self.output_dir, f"profile-{time.strftime('%Y%m%d-%H%M%S')}.folded")
+        with open(path, 'w') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+        total = sum(self.stacks.values())
+        leaves = Counter()
+        for stack, count in self.stacks.items():
+            leaves[stack.rsplit(';', 1)[-1]] += count
+        logger.info(f"Sampling profiler stopped after {total} samples, wrote {path}")
+        for leaf, count in leaves.most_common(5):
+            logger.info(f"  {100 * count / total:5.1f}% {leaf}")
+        return path
+
+    def toggle(self, *_):
+        """Signal handler: start the profiler if idle, otherwise stop and dump it"""
+        if self.running:
+            self.stop()
+        else:
+            self.start()
@@ -0,0 +1,92 @@
+"""Minimal UnixFS file DAG encoding for the resumable large-file add path.
+
+Builds the same balanced layout as ``ipfs add --raw-leaves --cid-version=1``
+with a fixed-size chunker: raw leaf blocks under dag-pb file nodes of at
+most 174 links. Only the pending links of each level are kept in memory.
+"""
+import base64
+import hashlib
+
+MAX_LINKS = 174
+RAW = 0x55
+DAG_PB = 0x70
+SHA2_256 = 0x12
+UNIXFS_FILE = 2
+
+def varint(n):
+    out = bytearray()
+    while n >= 0x80:
+        out.append((n & 0x7f) | 0x80)
+        n >>= 7
+    out.append(n)
+    return bytes(out)
+
+def _field(number, data):
+    """Length-delimited protobuf field"""
+    return varint(number << 3 | 2) + varint(len(data)) + data
+
+def _uint(number, value):
+    """Varint protobuf field"""
+    return varint(number << 3) + varint(value)
+
+def cid_bytes(codec, data):
+    return varint(1) + varint(codec) + bytes([SHA2_256, 32]) + hashlib.sha256(data).digest()
+
+def cid_str(cid):
+    return 'b' + base64.b32encode(cid).decode().lower().rstrip('=')
+
+class Link:
+    __slots__ = ('cid', 'tsize', 'filesize')
+
+    def __init__(self, cid, tsize, filesize):
+        self.cid = cid  # Binary CID
+        self.tsize = tsize  # Serialized size of the whole subtree
+        self.filesize = filesize  # File bytes under the subtree
+
+def raw_leaf(chunk):
+    return Link(cid_bytes(RAW, chunk), len(chunk), len(chunk))
+
+def file_node(links):
+    """Encode a dag-pb UnixFS file node over links; returns (block bytes, Link to it)"""
+    filesize = sum(link.filesize for link in links)
+    data = _uint(1, UNIXFS_FILE) + _uint(3, filesize) + b''.join(_uint(4, link.filesize) for link in links)
+    # dag-pb canonical form puts Links (field 2) before Data (field 1)
+    block = b''.join(
+        _field(2, _field(1, link.cid) + _field(2, b'') + _uint(3, link.tsize)) for link in links
+    ) + _field(1, data)
+    return block, Link(cid_bytes(DAG_PB, block), len(block) + sum(link.tsize for link in links), filesize)
+
+class DagBuilder:
+    """Streams leaf links in file order and emits parent nodes through put_node"""
+
+    def __init__(self, put_node):
+        self.put_node = put_node  # Called with each encoded dag-pb block
+        self.levels = [[]]
+
+    def _push(self, level, link):
+        if level == len(self.levels):
+            self.levels.append([])
+        self.levels[level].append(link)
+        if len(self.levels[level]) == MAX_LINKS:
+            self._emit(level)
+
+    def _emit(self, level):
+        block, link = file_node(self.levels[level])
+        self.put_node(block)
+        self.levels[level] = []
+        self._push(level + 1, link)
+
+    def add_leaf(self, link):
+        self._push(0, link)
+
+    def finish(self):
+        """Close every partial node and return the root Link"""
+        level = 0
+        while level < len(self.levels):
+            links = self.levels[level]
+            if level == len(self.levels) - 1 and len(links) == 1:
+                return links[0]
+            if links:
+                self._emit(level)
+            level += 1
+        raise ValueError("No leaves were added")